@@ -0,0 +1,412 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from media_probe import get_cache_dir, content_hash
+
+# Fingerprints are taken from the full mix at this rate
+FP_SAMPLE_RATE = 11025
+N_FFT = 2048
+HOP = 512
+FRAME_SECONDS = HOP / FP_SAMPLE_RATE
+
+# Frequency bands (FFT bins) each contributing one peak per frame
+PEAK_BANDS = [(1, 10), (10, 20), (20, 40), (40, 80), (80, 160), (160, 512)]
+
+# A band peak is kept only if it is the loudest within this many frames
+PEAK_TIME_SPAN = 3
+
+# Peaks paired with each anchor, and how far ahead (frames) they may be
+FAN_OUT = 5
+MAX_PAIR_FRAMES = 63
+
+# Matching thresholds
+MIN_MATCH_HASHES = 20
+OFFSET_TOLERANCE = 2
+MIN_OFFSET_VOTES = 10
+WINDOW_SECONDS = 2.0
+MIN_WINDOW_VOTES = 3
+
+# Share of the new file that must be covered to reuse an alignment
+MIN_COVERAGE = 0.6
+
+# Uncovered stretches shorter than this are not re-aligned, except
+# around edit points (see EDIT_MARGIN_SECONDS)
+MIN_GAP_SECONDS = 1.0
+
+# Seconds either side of a point where the offset changes (an edit)
+# that are re-aligned rather than carried over
+EDIT_MARGIN_SECONDS = 0.5
+
+# Frames of spectrogram computed per block, bounds peak memory
+SPECTRUM_BLOCK = 512
+
+# Bumped whenever the index schema or its keys change; a new version
+# starts a new file
+INDEX_VERSION = 3
+
+
+# =========================================
+# FINGERPRINT
+# =========================================
+
+def _spectrogram(samples):
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < N_FFT:
+        return np.zeros((0, N_FFT // 2 + 1), dtype=np.float32)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, N_FFT)[::HOP]
+    window = np.hanning(N_FFT).astype(np.float32)
+
+    blocks = []
+    for i in range(0, len(frames), SPECTRUM_BLOCK):
+        spectrum = np.abs(np.fft.rfft(frames[i:i + SPECTRUM_BLOCK] * window, axis=1))
+        blocks.append(np.log1p(spectrum).astype(np.float32))
+
+    return np.concatenate(blocks)
+
+
+def _peaks(spectrum):
+    """
+    (frame, bin) landmarks: the loudest bin of every band in every
+    frame, kept when it beats the band's neighbouring frames and the
+    frame's average band peak.
+    """
+    if not len(spectrum):
+        return []
+
+    band_bins = []
+    band_values = []
+    for lo, hi in PEAK_BANDS:
+        band = spectrum[:, lo:hi]
+        band_bins.append(band.argmax(axis=1) + lo)
+        band_values.append(band.max(axis=1))
+
+    values = np.stack(band_values, axis=1)
+    bins = np.stack(band_bins, axis=1)
+    frame_mean = values.mean(axis=1)
+
+    padded = np.pad(values, ((PEAK_TIME_SPAN, PEAK_TIME_SPAN), (0, 0)), constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * PEAK_TIME_SPAN + 1, axis=0)
+    local_max = windows.max(axis=-1)
+
+    keep = (values >= local_max) & (values > frame_mean[:, None]) & (values > 0)
+    frames, bands = np.nonzero(keep)
+
+    return sorted(zip(frames.tolist(), bins[frames, bands].tolist()))
+
+
+def fingerprint(samples):
+    """
+    Landmark hashes of mono FP_SAMPLE_RATE audio: every peak paired with
+    the next few peaks, hashed as (anchor bin, target bin, frame gap).
+    Returns [(hash, anchor_frame)].
+    """
+    peaks = _peaks(_spectrogram(samples))
+    hashes = []
+
+    for i, (t1, f1) in enumerate(peaks):
+        paired = 0
+        for t2, f2 in peaks[i + 1:]:
+            dt = t2 - t1
+            if dt > MAX_PAIR_FRAMES:
+                break
+            if dt == 0:
+                continue
+            hashes.append(((f1 & 1023) << 16 | (f2 & 1023) << 6 | dt, t1))
+            paired += 1
+            if paired == FAN_OUT:
+                break
+
+    return hashes
+
+
+# =========================================
+# REGIONS
+# =========================================
+
+def _inside(regions, t, offset):
+    return any(start <= t <= end and o == offset for start, end, o in regions)
+
+
+def map_words(words, regions):
+    """
+    Moves words aligned on a matched recording onto the new one. A
+    region (start, end, offset) says new time t plays old time
+    t + offset; a word is carried over when both its ends fall in
+    regions of the same offset (one region, or two split only by a
+    short unmatched stretch).
+    """
+    mapped = []
+    for offset in {o for _, _, o in regions}:
+        for word in words:
+            new_start = word["start"] - offset
+            new_end = word["end"] - offset
+            if _inside(regions, new_start, offset) and _inside(regions, new_end, offset):
+                mapped.append({"word": word["word"], "start": new_start, "end": new_end})
+
+    return sorted(mapped, key=lambda w: w["start"])
+
+
+def uncovered(regions, duration, min_gap=MIN_GAP_SECONDS):
+    """
+    Stretches of [0, duration] no region covers, longer than min_gap.
+    Gaps at an edit point (between regions of different offsets) are
+    always kept, however short.
+    """
+    gaps = []
+    cursor = 0.0
+    cursor_offset = None
+
+    for start, end, offset in sorted(regions):
+        edit = cursor_offset is not None and offset != cursor_offset
+        if start - cursor >= min_gap or (edit and start > cursor):
+            gaps.append((cursor, start))
+        if end >= cursor:
+            cursor, cursor_offset = end, offset
+
+    if duration - cursor >= min_gap:
+        gaps.append((cursor, duration))
+
+    return gaps
+
+
+def coverage(regions, duration):
+    if not duration:
+        return 0.0
+    covered = duration - sum(end - start for start, end in uncovered(regions, duration, min_gap=0.0))
+    return covered / duration
+
+
+def _split_frame(frames_a, frames_b, lo, hi):
+    """
+    Frame in [lo, hi] where offset A hands over to offset B: the split
+    that agrees with the most votes (A's before it, B's after).
+    """
+    events = sorted([(f, 1) for f in frames_a] + [(f, -1) for f in frames_b])
+
+    # Votes agreeing with splitting at lo, then updated frame by frame
+    score = sum(1 for f in frames_b if f >= lo) + sum(1 for f in frames_a if f < lo)
+    best, best_score = lo, score
+
+    for frame, kind in events:
+        if frame < lo or frame >= hi:
+            continue
+        score += kind
+        if score > best_score:
+            best, best_score = frame + 1, score
+
+    return best
+
+
+def _regions(matches, margin=EDIT_MARGIN_SECONDS):
+    """
+    Splits a match's (query_frame, offset) votes into regions of
+    constant offset: each WINDOW_SECONDS window of the new file takes
+    its most voted offset and runs of equal offsets are merged. Edges
+    are then refined to single frames from the votes themselves, and
+    `margin` seconds either side of an edit point are left uncovered
+    so words there get re-aligned instead of taking a wrong offset.
+    """
+    totals = Counter(offset for _, offset in matches)
+    strong = {offset for offset, votes in totals.items() if votes >= MIN_OFFSET_VOTES}
+
+    window = max(1, int(WINDOW_SECONDS / FRAME_SECONDS))
+    per_window = defaultdict(Counter)
+    frames_by_offset = defaultdict(list)
+    for frame, offset in matches:
+        if offset in strong:
+            per_window[frame // window][offset] += 1
+            frames_by_offset[offset].append(frame)
+
+    # Runs of windows: [first window, last window, offset]
+    runs = []
+    for idx in sorted(per_window):
+        offset, votes = per_window[idx].most_common(1)[0]
+        if votes < MIN_WINDOW_VOTES:
+            continue
+
+        if runs and runs[-1][2] == offset and runs[-1][1] == idx - 1:
+            runs[-1][1] = idx
+        else:
+            runs.append([idx, idx, offset])
+
+    # Frame edges: outer edges snap to the run's first and last vote
+    regions = []
+    for first, last, offset in runs:
+        frames = [f for f in frames_by_offset[offset] if first * window <= f < (last + 1) * window]
+        regions.append([min(frames), max(frames) + 1, offset])
+
+    margin_frames = int(round(margin / FRAME_SECONDS))
+
+    for i, (a, b) in enumerate(zip(regions, regions[1:])):
+        if a[2] == b[2]:
+            continue
+
+        lo, hi = runs[i][1] * window, (runs[i + 1][0] + 1) * window
+        if runs[i + 1][0] == runs[i][1] + 1:
+            # Adjacent windows: find the edit point between them
+            split = _split_frame(
+                [f for f in frames_by_offset[a[2]] if lo <= f < hi],
+                [f for f in frames_by_offset[b[2]] if lo <= f < hi],
+                max(a[0], lo),
+                min(b[1], hi)
+            )
+            a[1], b[0] = split, split
+
+        a[1] -= margin_frames
+        b[0] += margin_frames
+
+    return [
+        (start * FRAME_SECONDS, end * FRAME_SECONDS, offset * OFFSET_TOLERANCE * FRAME_SECONDS)
+        for start, end, offset in regions
+        if end > start
+    ]
+
+
+# =========================================
+# INDEX
+# =========================================
+
+def alignment_key(lyrics, model=None):
+    """
+    Alignments are only reused for the same lyrics ("" = transcribed)
+    aligned by the same Whisper model.
+    """
+    text = re.sub(r"\s+", " ", lyrics or "").strip().lower()
+    return hashlib.sha1(f"{model or ''}\n{text}".encode("utf-8")).hexdigest()
+
+
+class FingerprintIndex:
+    """
+    Landmark fingerprints and word alignments of every song processed,
+    in SQLite. match() finds an earlier recording, aligned to the same
+    lyrics by the same model, sharing material with new audio (another edit or version
+    of the song) and the time regions they share, so its alignment can
+    be carried over.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(get_cache_dir("fingerprints"), f"index_v{INDEX_VERSION}.db")
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS songs (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT,
+                    audio_hash TEXT,
+                    align_key TEXT,
+                    duration REAL,
+                    words TEXT,
+                    created REAL,
+                    UNIQUE (audio_hash, align_key)
+                );
+                CREATE TABLE IF NOT EXISTS hashes (
+                    hash INTEGER,
+                    song_id INTEGER,
+                    frame INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS hashes_hash ON hashes(hash);
+                """
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def add(self, audio_path, samples, words, lyrics=None, model=None):
+        """
+        Stores the fingerprint and alignment of `audio_path`; a file
+        already indexed for these lyrics and model only gets its words
+        replaced.
+        """
+        key = content_hash(audio_path)
+        align_key = alignment_key(lyrics, model)
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT id FROM songs WHERE audio_hash = ? AND align_key = ?",
+                (key, align_key)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE songs SET words = ? WHERE id = ?", (json.dumps(words), row[0]))
+                return row[0]
+
+            cur = conn.execute(
+                "INSERT INTO songs (path, audio_hash, align_key, duration, words, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (audio_path, key, align_key, len(samples) / FP_SAMPLE_RATE, json.dumps(words), time.time())
+            )
+            song_id = cur.lastrowid
+
+            conn.executemany(
+                "INSERT INTO hashes (hash, song_id, frame) VALUES (?, ?, ?)",
+                ((h, song_id, frame) for h, frame in fingerprint(samples))
+            )
+            return song_id
+
+    def words_for(self, song_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT words FROM songs WHERE id = ?", (song_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else []
+
+    def match(self, audio_path, samples, lyrics=None, model=None):
+        """
+        Returns (song_id, regions) for the recording aligned to the same
+        lyrics by the same model that shares most material with the new
+        audio, or None. An identical file matches whole without
+        fingerprinting.
+        """
+        duration = len(samples) / FP_SAMPLE_RATE
+        align_key = alignment_key(lyrics, model)
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id FROM songs WHERE audio_hash = ? AND align_key = ?",
+                (content_hash(audio_path), align_key)
+            ).fetchone()
+        if row:
+            return row[0], [(0.0, duration, 0.0)]
+
+        query = defaultdict(list)
+        for h, frame in fingerprint(samples):
+            query[h].append(frame)
+
+        votes = defaultdict(list)
+        keys = list(query)
+
+        with self._connect() as conn:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = conn.execute(
+                    "SELECT h.hash, h.song_id, h.frame FROM hashes h "
+                    "JOIN songs s ON s.id = h.song_id "
+                    f"WHERE s.align_key = ? AND h.hash IN ({','.join('?' * len(batch))})",
+                    [align_key] + batch
+                ).fetchall()
+
+                for h, song_id, frame in rows:
+                    for query_frame in query[h]:
+                        # Offsets are binned so tempo jitter still votes together
+                        offset = int(round((frame - query_frame) / OFFSET_TOLERANCE))
+                        votes[song_id].append((query_frame, offset))
+
+        best = None
+        best_votes = 0
+        for song_id, matches in votes.items():
+            top = Counter(offset for _, offset in matches).most_common(1)[0][1]
+            if top > best_votes:
+                best, best_votes = song_id, top
+
+        if best is None or best_votes < MIN_MATCH_HASHES:
+            return None
+
+        return best, _regions(votes[best])
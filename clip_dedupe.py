@@ -0,0 +1,169 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from ffmpeg_utils import get_ffmpeg_path
+from http_transport import default_transport
+
+# dHash grid: 9x8 grayscale gives 8x8 = 64 left/right gradient bits
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+# Hashes this many bits apart (or fewer) count as the same footage
+MAX_DISTANCE = 6
+
+# Bands for the Hamming index. With more bands than MAX_DISTANCE, two
+# hashes within the distance must agree exactly on at least one band
+BANDS = 8
+BAND_BITS = 64 // BANDS
+
+
+def _decode_gray(source, data=None):
+    """
+    Decodes an image to a HASH_WIDTH x HASH_HEIGHT grayscale grid with
+    ffmpeg, from a path or from bytes piped on stdin.
+    """
+    command = [
+        get_ffmpeg_path(),
+        "-v", "error",
+        "-i", "-" if data is not None else source,
+        "-frames:v", "1",
+        "-vf", f"scale={HASH_WIDTH}:{HASH_HEIGHT}:flags=area,format=gray",
+        "-f", "rawvideo",
+        "-"
+    ]
+
+    result = subprocess.run(
+        command,
+        input=data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True
+    )
+
+    pixels = result.stdout
+    if len(pixels) != HASH_WIDTH * HASH_HEIGHT:
+        raise ValueError(f"Unexpected decode size {len(pixels)} for {source}")
+    return pixels
+
+
+def dhash(pixels):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair,
+    set when brightness increases to the right.
+    """
+    value = 0
+    for y in range(HASH_HEIGHT):
+        row = pixels[y * HASH_WIDTH:(y + 1) * HASH_WIDTH]
+        for x in range(HASH_WIDTH - 1):
+            value = (value << 1) | (row[x + 1] > row[x])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def preview_hash(preview, transport=None):
+    """
+    dHash of a result's preview image: a local thumbnail path or a
+    provider image URL. Returns None when the preview is unusable.
+    """
+    if not preview:
+        return None
+
+    try:
+        if os.path.exists(str(preview)):
+            return dhash(_decode_gray(preview))
+
+        transport = transport or default_transport()
+        response = transport.get(preview)
+        response.raise_for_status()
+        return dhash(_decode_gray(preview, data=response.content))
+
+    except Exception as e:
+        print(f"[Dedupe] Could not hash preview {preview}: {e}")
+        return None
+
+
+class HammingIndex:
+    """
+    Finds stored hashes within MAX_DISTANCE bits of a query without
+    comparing against all of them: hashes are bucketed by each band,
+    and only hashes sharing a band with the query are compared.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.buckets = [{} for _ in range(BANDS)]
+        self.hashes = []
+
+    @staticmethod
+    def _bands(value):
+        mask = (1 << BAND_BITS) - 1
+        return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+    def add(self, value):
+        idx = len(self.hashes)
+        self.hashes.append(value)
+        for band, key in enumerate(self._bands(value)):
+            self.buckets[band].setdefault(key, []).append(idx)
+        return idx
+
+    def near(self, value):
+        candidates = set()
+        for band, key in enumerate(self._bands(value)):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        return [
+            idx for idx in candidates
+            if hamming(self.hashes[idx], value) <= self.max_distance
+        ]
+
+
+def dedupe_videos(videos: List[Dict], transport=None, max_workers=8) -> List[Dict]:
+    """
+    Drops near-duplicate clips (the same footage from both providers,
+    re-uploads, re-encodes) by clustering the perceptual hashes of their
+    previews. `videos` must be ranked best-first: each cluster keeps a
+    local clip when it has one (nothing to download), otherwise its
+    highest-ranked member. Clips without a usable preview are kept.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        hashes = list(pool.map(
+            lambda v: preview_hash(v.get("preview"), transport),
+            videos
+        ))
+
+    index = HammingIndex()
+    # index slot -> position of the cluster's first (best-ranked) member
+    cluster_pos = {}
+    # position -> clip kept there; a preferred later member takes over
+    # its cluster's position so it keeps the cluster's rank
+    kept = {}
+
+    for pos, (video, value) in enumerate(zip(videos, hashes)):
+        if value is None:
+            kept[pos] = video
+            continue
+
+        matches = index.near(value)
+
+        if not matches:
+            cluster_pos[index.add(value)] = pos
+            kept[pos] = video
+            continue
+
+        first = cluster_pos[min(matches)]
+
+        if video.get("local_path") and not kept[first].get("local_path"):
+            kept[first] = video
+
+    result = [kept[pos] for pos in sorted(kept)]
+
+    dropped = len(videos) - len(result)
+    if dropped:
+        print(f"[Dedupe] Dropped {dropped} near-duplicate clips")
+
+    return result
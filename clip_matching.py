@@ -0,0 +1,170 @@
+import re
+from typing import List, Dict
+
+# How far ahead in the lyrics a timeline word may be matched
+LOOKAHEAD_TOKENS = 8
+
+# Penalty per previous use of a clip when scoring candidates
+REUSE_PENALTY = 1.0
+
+# Penalty for showing a clip whose keyword does not match the entry
+MISMATCH_PENALTY = 3.0
+
+
+def normalize_keyword(text):
+    text = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def map_entries_to_lines(timeline: List[Dict], lines: List[str]) -> List[int | None]:
+    """
+    Returns the lyric line index of every timeline entry by walking the
+    lyric tokens alongside the aligned words. Each entry only looks a
+    few tokens ahead, so this stays linear in the timeline length.
+    """
+    tokens = []
+    for line_idx, line in enumerate(lines):
+        for token in normalize_keyword(line).split():
+            tokens.append((token, line_idx))
+
+    if not tokens:
+        return [None] * len(timeline)
+
+    mapping = []
+    cursor = 0
+
+    for entry in timeline:
+        # Coalesced entries hold several words; the first one decides
+        # the entry's line, the rest only advance the cursor
+        line_idx = None
+
+        for word in normalize_keyword(entry.get("text", "")).split() or [""]:
+            for pos in range(cursor, min(cursor + LOOKAHEAD_TOKENS, len(tokens))):
+                if tokens[pos][0] == word:
+                    cursor = pos + 1
+                    matched = tokens[pos][1]
+                    break
+            else:
+                # No match nearby: stay on the current line and move on
+                matched = tokens[min(cursor, len(tokens) - 1)][1]
+                cursor = min(cursor + 1, len(tokens))
+
+            if line_idx is None:
+                line_idx = matched
+
+        mapping.append(line_idx)
+
+    return mapping
+
+
+def clip_durations(videos: List[Dict]) -> List[float | None]:
+    durations = []
+    for video in videos:
+        probe = video.get("probe") or {}
+        duration = probe.get("duration") or video.get("duration")
+        durations.append(float(duration) if duration else None)
+    return durations
+
+
+class ClipIndex:
+    """
+    Maps keywords to clips and lyric lines to keywords so each timeline
+    entry can be matched to a relevant clip with a few dict lookups.
+    """
+
+    def __init__(self, videos: List[Dict], lines: List[str] = None, line_keywords: List[List[str]] = None):
+        self.num_clips = len(videos)
+
+        # keyword -> clip indices
+        self.keyword_clips = {}
+        # single token -> keywords containing it
+        self.token_keywords = {}
+
+        for idx, video in enumerate(videos):
+            keyword = normalize_keyword(video.get("keyword_query", ""))
+            if not keyword:
+                continue
+            self.keyword_clips.setdefault(keyword, []).append(idx)
+
+        for keyword in self.keyword_clips:
+            for token in keyword.split():
+                self.token_keywords.setdefault(token, []).append(keyword)
+
+        self.lines = lines or []
+        self.line_keywords = [
+            [normalize_keyword(k) for k in kws if normalize_keyword(k) in self.keyword_clips]
+            for kws in (line_keywords or [])
+        ]
+
+    def _candidate_keywords(self, text, line_idx):
+        keywords = []
+        for token in text.split():
+            keywords += self.token_keywords.get(token, [])
+
+        if line_idx is not None and line_idx < len(self.line_keywords):
+            keywords += self.line_keywords[line_idx]
+
+        return keywords
+
+    def assign(self, timeline: List[Dict], durations: List[float | None], fps=24) -> List[int]:
+        """
+        Picks a clip for every timeline entry. Clips whose keyword matches
+        the entry's word or lyric line are preferred; among those the
+        least-used one wins, and the clip just shown is avoided. Entries
+        without a match fall back to a rotation over all clips.
+        """
+        if not self.num_clips:
+            return []
+
+        line_map = map_entries_to_lines(timeline, self.lines)
+
+        uses = [0] * self.num_clips
+        assignments = []
+        rotation = 0
+        previous = None
+
+        for entry, line_idx in zip(timeline, line_map):
+            needed = max(1.0 / fps, entry["duration"])
+
+            def fits(idx):
+                return durations[idx] is None or durations[idx] >= needed
+
+            def score(idx):
+                return uses[idx] * REUSE_PENALTY + (idx == previous) * REUSE_PENALTY * 2
+
+            # Next unmatched clip in rotation, used when no relevant clip
+            # is good enough
+            fallback = None
+            for step in range(self.num_clips):
+                candidate = (rotation + step) % self.num_clips
+                if fits(candidate) and candidate != previous:
+                    fallback = candidate
+                    break
+
+            if fallback is None:
+                # Repeating the clip just shown beats one that runs past
+                # the end of its media; the rotation only applies when
+                # nothing fits at all
+                if previous is not None and fits(previous):
+                    fallback = previous
+                else:
+                    fallback = rotation % self.num_clips
+
+            best = fallback
+            best_score = score(fallback) + MISMATCH_PENALTY
+
+            text = normalize_keyword(entry.get("text", ""))
+
+            for keyword in self._candidate_keywords(text, line_idx):
+                for idx in self.keyword_clips[keyword]:
+                    if fits(idx) and score(idx) < best_score:
+                        best, best_score = idx, score(idx)
+
+            if best == fallback:
+                rotation = fallback + 1
+
+            uses[best] += 1
+            previous = best
+            assignments.append(best)
+
+        return assignments
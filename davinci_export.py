@@ -2,6 +2,9 @@ from xml.etree.ElementTree import Element, SubElement, tostring
 import xml.dom.minidom
 import os
 import urllib.parse
+from fractions import Fraction
+
+from timeline_builder import assign_clips
 
 
 def seconds_to_fcp_time(seconds, fps):
@@ -9,13 +12,42 @@ def seconds_to_fcp_time(seconds, fps):
     return f"{frames}/{fps}s"
 
 
+def _rational_time(value):
+    value = Fraction(value)
+    if value.denominator == 1:
+        return f"{value.numerator}s"
+    return f"{value.numerator}/{value.denominator}s"
+
+
+def frame_duration(fps):
+    return _rational_time(1 / Fraction(fps))
+
+
+def seconds_to_frame_time(seconds, fps):
+    """
+    Like seconds_to_fcp_time but for fractional rates (e.g. 30000/1001),
+    snapped to whole frames of the clip's own timebase.
+    """
+    fps = Fraction(fps)
+    frames = int(round(seconds * fps))
+    return _rational_time(frames / fps)
+
+
 def export_fcpxml(
     videos,
     timeline,
     resolution="1080p",
     fps=24,
-    output_path="LyricVision_Output.fcpxml"
+    output_path="LyricVision_Output.fcpxml",
+    assignments=None,
+    in_points=None
 ):
+    """
+    assignments optionally gives the index into `videos` used for each
+    timeline entry; by default clips are assigned round-robin.
+    in_points optionally gives the seconds into the clip each entry
+    starts at; by default every entry starts at the head of its clip.
+    """
 
     if not timeline:
         raise ValueError("Timeline empty.")
@@ -41,6 +73,9 @@ def export_fcpxml(
     })
 
     asset_ids = []
+    asset_durations = []
+    asset_fps = []
+    asset_formats = {}
 
     # =====================================================
     # CREATE ASSETS (STRICT LOCAL FILE REQUIREMENT)
@@ -56,8 +91,33 @@ def export_fcpxml(
         asset_id = f"a{i+1}"
         asset_ids.append(asset_id)
 
-        duration_seconds = float(video.get("duration", 5))
-        duration_tc = seconds_to_fcp_time(duration_seconds, fps)
+        # Prefer probed metadata over what the provider reported
+        probe = video.get("probe") or {}
+
+        clip_fps = probe.get("fps") or fps
+        asset_fps.append(clip_fps)
+        clip_width = probe.get("width") or width
+        clip_height = probe.get("height") or height
+
+        format_key = (Fraction(clip_fps), clip_width, clip_height)
+
+        if format_key == (Fraction(fps), width, height):
+            clip_format_id = format_id
+        elif format_key in asset_formats:
+            clip_format_id = asset_formats[format_key]
+        else:
+            clip_format_id = f"r{len(asset_formats) + 2}"
+            asset_formats[format_key] = clip_format_id
+            SubElement(resources, "format", {
+                "id": clip_format_id,
+                "frameDuration": frame_duration(clip_fps),
+                "width": str(clip_width),
+                "height": str(clip_height)
+            })
+
+        duration_seconds = float(probe.get("duration") or video.get("duration") or 5)
+        asset_durations.append(duration_seconds)
+        duration_tc = seconds_to_frame_time(duration_seconds, clip_fps)
 
         abs_path = os.path.abspath(local_path)
         encoded_path = urllib.parse.quote(abs_path)
@@ -69,7 +129,7 @@ def export_fcpxml(
             "start": "0s",
             "duration": duration_tc,
             "hasVideo": "1",
-            "format": format_id
+            "format": clip_format_id
         })
 
         SubElement(asset, "media-rep", {
@@ -77,6 +137,14 @@ def export_fcpxml(
             "src": file_url
         })
 
+        proxy_path = video.get("proxy_path")
+
+        if proxy_path and os.path.exists(proxy_path):
+            SubElement(asset, "media-rep", {
+                "kind": "proxy-media",
+                "src": f"file://{urllib.parse.quote(os.path.abspath(proxy_path))}"
+            })
+
     # =====================================================
     # BUILD SEQUENCE
     # =====================================================
@@ -103,22 +171,41 @@ def export_fcpxml(
 
     current_offset = 0.0
 
+    if assignments is None:
+        assignments = assign_clips(timeline, asset_durations, fps=fps)
+
     for i, clip in enumerate(timeline):
 
-        asset_id = asset_ids[i % len(asset_ids)]
+        asset_idx = assignments[i]
+        asset_id = asset_ids[asset_idx]
+
+        in_point = in_points[i] if in_points is not None else 0.0
+        clip_fps = asset_fps[asset_idx]
+        start_tc = seconds_to_frame_time(in_point, clip_fps) if in_point else "0s"
 
         duration_seconds = max(1.0 / fps, clip["duration"])
         duration_tc = seconds_to_fcp_time(duration_seconds, fps)
         offset_tc = seconds_to_fcp_time(current_offset, fps)
 
-        SubElement(spine, "asset-clip", {
+        asset_clip = SubElement(spine, "asset-clip", {
             "name": clip.get("text", ""),
             "ref": asset_id,
             "offset": offset_tc,
-            "start": "0s",
+            "start": start_tc,
             "duration": duration_tc
         })
 
+        # Coalesced shots keep their words as markers, in clip time
+        for word in clip.get("words", []):
+            SubElement(asset_clip, "marker", {
+                "start": seconds_to_frame_time(
+                    in_point + word["start"] - clip["start"],
+                    clip_fps
+                ),
+                "duration": frame_duration(clip_fps),
+                "value": word.get("text", "")
+            })
+
         current_offset += duration_seconds
 
     xml_str = tostring(fcpxml)
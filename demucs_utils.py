@@ -1,11 +1,16 @@
 import os
-import subprocess
+import shutil
 
+from model_scheduler import get_scheduler
+from resource_config import get_resource_config
+from job_control import JobCancelled, run
 
-def separate_stems(audio_path, output_dir):
+
+def separate_stems(audio_path, output_dir, cancel=None):
     """
     Runs Demucs to separate stems into the given output directory.
-    Returns the folder containing separated stems.
+    Returns the folder containing separated stems. Cancelling `cancel`
+    kills Demucs and removes its partial output.
     """
 
     os.makedirs(output_dir, exist_ok=True)
@@ -18,22 +23,33 @@ def separate_stems(audio_path, output_dir):
         audio_path
     ]
 
-    subprocess.run(command, check=True)
-
     # Demucs creates:
     # output_dir/htdemucs/<filename_without_ext>/
     base_name = os.path.splitext(os.path.basename(audio_path))[0]
     stems_path = os.path.join(output_dir, "htdemucs", base_name)
 
+    # Demucs runs out of process but still needs its share of RAM
+    with get_scheduler().reserve("htdemucs"):
+        try:
+            run(
+                command,
+                cancel=cancel,
+                check=True,
+                env=get_resource_config().subprocess_env("demucs")
+            )
+        except JobCancelled:
+            shutil.rmtree(stems_path, ignore_errors=True)
+            raise
+
     return stems_path
 
 
-def separate_vocals(audio_path, output_dir):
+def separate_vocals(audio_path, output_dir, cancel=None):
     """
     Returns path to isolated vocals file.
     """
 
-    stems_path = separate_stems(audio_path, output_dir)
+    stems_path = separate_stems(audio_path, output_dir, cancel=cancel)
 
     vocals_path = os.path.join(stems_path, "vocals.wav")
 
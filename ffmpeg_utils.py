@@ -3,6 +3,8 @@ import os
 import tempfile
 import sys
 
+from job_control import run
+
 def get_ffmpeg_path():
     """
     Returns bundled ffmpeg path if running in PyInstaller,
@@ -12,6 +14,15 @@ def get_ffmpeg_path():
         return os.path.join(sys._MEIPASS, "ffmpeg")
     return "ffmpeg"
 
+def get_ffprobe_path():
+    """
+    Returns bundled ffprobe path if running in PyInstaller,
+    otherwise assumes ffprobe is in PATH.
+    """
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, "ffprobe")
+    return "ffprobe"
+
 def convert_to_wav(input_path):
     """
     Converts any audio format to 44.1kHz WAV using ffmpeg.
@@ -50,4 +61,48 @@ def extract_audio_from_video(video_path):
     ]
 
     subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return temp_wav
\ No newline at end of file
+    return temp_wav
+
+def fetch_clip_range(url, output_path, duration, start=0.0, cancel=None):
+    """
+    Pulls only [start, start + duration] of a remote clip using
+    stream copy. Raises CalledProcessError if ffmpeg cannot read
+    the range (e.g. the server does not allow seeking).
+    """
+    ffmpeg = get_ffmpeg_path()
+
+    command = [
+        ffmpeg,
+        "-y",
+        "-ss", f"{start:.3f}",
+        "-t", f"{duration:.3f}",
+        "-i", url,
+        "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
+        output_path
+    ]
+
+    run(command, cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return output_path
+
+
+def extract_audio_range(input_path, output_path, start, duration):
+    """
+    Decodes [start, start + duration] of an audio file to a 44.1kHz
+    stereo WAV, sample-accurate (no stream copy).
+    """
+    ffmpeg = get_ffmpeg_path()
+
+    command = [
+        ffmpeg,
+        "-y",
+        "-i", input_path,
+        "-ss", f"{start:.3f}",
+        "-t", f"{duration:.3f}",
+        "-ar", "44100",
+        "-ac", "2",
+        output_path
+    ]
+
+    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return output_path
@@ -0,0 +1,194 @@
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Latency samples kept per host for percentiles
+LATENCY_WINDOW = 200
+
+
+class HostStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+        }
+
+
+class HttpTransport:
+    """
+    Shared HTTP layer for provider calls: one keep-alive session per
+    host, retries with exponential backoff and jitter (honouring
+    Retry-After), and per-host latency metrics.
+    """
+
+    def __init__(
+        self,
+        max_retries=4,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        pool_size=8,
+        timeout=10
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        self._sessions = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    # ======================================================
+    # SESSIONS
+    # ======================================================
+
+    def _session_for(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._stats[host] = HostStats()
+            return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    # ======================================================
+    # METRICS
+    # ======================================================
+
+    def stats(self, host=None):
+        with self._lock:
+            if host is not None:
+                stats = self._stats.get(host)
+                return stats.as_dict() if stats else None
+            return {h: s.as_dict() for h, s in self._stats.items()}
+
+    def _record(self, host, latency=None, error=False, retry=False):
+        with self._lock:
+            stats = self._stats[host]
+            if retry:
+                stats.retries += 1
+                return
+            stats.requests += 1
+            if error:
+                stats.errors += 1
+            if latency is not None:
+                stats.latencies.append(latency)
+
+    # ======================================================
+    # REQUESTS
+    # ======================================================
+
+    def _retry_after(self, response):
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def _backoff(self, attempt):
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # Equal jitter: never less than half the cap
+        return cap / 2 + random.uniform(0, cap / 2)
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request, retrying connection errors, timeouts and
+        retryable statuses. Returns the last response; callers still
+        call raise_for_status().
+        """
+        host = urlsplit(url).netloc
+        session = self._session_for(host)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._record(host, error=True)
+                if attempt == self.max_retries:
+                    raise
+                self._record(host, retry=True)
+                time.sleep(self._backoff(attempt))
+                continue
+
+            latency = time.monotonic() - started
+            retryable = response.status_code in RETRY_STATUSES
+            self._record(host, latency=latency, error=retryable)
+
+            if not retryable or attempt == self.max_retries:
+                return response
+
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+
+            print(f"[HTTP] {host} returned {response.status_code}, retrying in {delay:.1f}s")
+            response.close()
+            self._record(host, retry=True)
+            time.sleep(min(delay, self.backoff_max))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+
+_default_transport = None
+_default_lock = threading.Lock()
+
+
+def default_transport():
+    global _default_transport
+    with _default_lock:
+        if _default_transport is None:
+            _default_transport = HttpTransport()
+        return _default_transport
@@ -0,0 +1,200 @@
+import os
+import signal
+import threading
+import subprocess
+
+from model_scheduler import get_scheduler
+
+# Seconds a terminated child process gets to exit before it is killed
+KILL_GRACE_SECONDS = 3.0
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job once it has been cancelled. Stages re-raise it
+    past their own error handling, as they do PipelineError.
+    """
+
+
+class JobActive(Exception):
+    """
+    Raised when a job is started for a project that already has one
+    running.
+    """
+
+
+def _signal(proc, sig):
+    try:
+        if os.name == "posix":
+            # The child leads its own process group, so anything it
+            # spawned (Demucs workers) goes down with it
+            os.killpg(proc.pid, sig)
+        elif sig == signal.SIGTERM:
+            proc.terminate()
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+def _terminate(proc):
+    if proc.poll() is not None:
+        return
+
+    _signal(proc, signal.SIGTERM)
+
+    def _kill():
+        if proc.poll() is None:
+            _signal(proc, getattr(signal, "SIGKILL", signal.SIGTERM))
+
+    timer = threading.Timer(KILL_GRACE_SECONDS, _kill)
+    timer.daemon = True
+    timer.start()
+
+
+class CancelToken:
+    """
+    Cancellation flag shared by everything one job runs. Work checks it
+    at stage boundaries and between items; child processes started with
+    run() and callbacks registered with on_cancel() (e.g. closing an
+    open download) are stopped the moment cancel() is called.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled("Job cancelled.")
+
+    def on_cancel(self, callback):
+        """
+        Runs callback() on cancel, right away if already cancelled.
+        Returns a function that unregisters it.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def remove():
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return remove
+
+        callback()
+        return lambda: None
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[Cancel Error] {e}")
+
+    def run(self, command, check=False, input=None, **kwargs):
+        """
+        subprocess.run() whose child is terminated (then killed) when
+        the job is cancelled, raising JobCancelled instead of a process
+        error.
+        """
+        self.check()
+
+        if input is not None:
+            kwargs["stdin"] = subprocess.PIPE
+        if os.name == "posix":
+            kwargs["start_new_session"] = True
+
+        with subprocess.Popen(command, **kwargs) as proc:
+            remove = self.on_cancel(lambda: _terminate(proc))
+            try:
+                stdout, stderr = proc.communicate(input)
+            finally:
+                remove()
+
+        self.check()
+
+        if check and proc.returncode:
+            raise subprocess.CalledProcessError(proc.returncode, command, stdout, stderr)
+
+        return subprocess.CompletedProcess(command, proc.returncode, stdout, stderr)
+
+
+def run(command, cancel=None, **kwargs):
+    """
+    subprocess.run(), cancellable when given the job's CancelToken.
+    """
+    if cancel is None:
+        return subprocess.run(command, **kwargs)
+    return cancel.run(command, **kwargs)
+
+
+_active = {}
+_active_lock = threading.Lock()
+
+
+class JobHandle:
+    """
+    A job running target(cancel_token, *args) on its own thread. Only
+    one handle per project (the output folder) runs at a time; start()
+    raises JobActive otherwise. A cancelled job unloads the idle models
+    it leaves behind so their memory is returned straight away.
+    """
+
+    def __init__(self, project, target, *args):
+        self.project = os.path.realpath(project)
+        self.cancel_token = CancelToken()
+        self._target = target
+        self._args = args
+        self._thread = None
+        self._done = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._done.is_set()
+
+    def start(self):
+        with _active_lock:
+            current = _active.get(self.project)
+            if current is not None and current.running:
+                raise JobActive(f"A job is already running for {self.project}")
+
+            _active[self.project] = self
+            self._thread = threading.Thread(target=self._run, daemon=True)
+
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            self._target(self.cancel_token, *self._args)
+        except JobCancelled:
+            pass
+        finally:
+            if self.cancel_token.cancelled:
+                get_scheduler().unload_all()
+
+            with _active_lock:
+                if _active.get(self.project) is self:
+                    del _active[self.project]
+
+            self._done.set()
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import threading
+
+# Bumped whenever the stored layout changes; older journals are ignored
+JOURNAL_VERSION = 1
+
+
+def write_json_atomic(path, data):
+    """
+    Writes JSON under a temp name, flushed to disk, then renames it over
+    `path`, so a crash at any point leaves either the old file or the
+    new one, never a truncated mix.
+    """
+    partial_path = path + ".part"
+
+    with open(partial_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(partial_path, path)
+    return path
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class JobJournal:
+    """
+    Completed stages of one job and the artifacts they produced,
+    rewritten atomically on every change. A run restarted with the
+    same inputs (`key`) resumes after the last completed stage; a
+    journal written for different inputs is discarded.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+
+        data = read_json(path)
+        if not data or data.get("version") != JOURNAL_VERSION or data.get("key") != key:
+            data = {"version": JOURNAL_VERSION, "key": key, "stages": {}}
+
+        self._data = data
+
+    @property
+    def resumed(self):
+        return bool(self._data["stages"])
+
+    def _entry(self, stage):
+        return self._data["stages"].setdefault(
+            stage,
+            {"started": time.time(), "finished": None, "artifacts": {}}
+        )
+
+    def _save(self):
+        write_json_atomic(self.path, self._data)
+
+    def completed(self, stage):
+        """
+        Artifacts of `stage` if an earlier run finished it, else None.
+        """
+        entry = self._data["stages"].get(stage)
+        if entry and entry["finished"]:
+            return entry["artifacts"]
+        return None
+
+    def artifacts(self, stage):
+        """
+        Everything recorded for `stage` so far, finished or not.
+        """
+        entry = self._data["stages"].get(stage)
+        return dict(entry["artifacts"]) if entry else {}
+
+    def record(self, stage, name, value):
+        """
+        Records one artifact of a stage still in progress, e.g. a clip
+        that finished downloading.
+        """
+        with self._lock:
+            self._entry(stage)["artifacts"][name] = value
+            self._save()
+
+    def complete(self, stage, **artifacts):
+        with self._lock:
+            entry = self._entry(stage)
+            entry["artifacts"].update(artifacts)
+            entry["finished"] = time.time()
+            self._save()
+
+    def clear(self):
+        """
+        Drops the journal once the job has finished.
+        """
+        with self._lock:
+            self._data["stages"] = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def reconcile_downloads(videos, clips, download_dir):
+    """
+    Matches a media folder left by an interrupted run against the
+    journal: candidates whose clip was recorded as downloaded and is
+    still on disk get their local_path back (download_videos then
+    keeps them as-is), and temp files of downloads that never finished
+    are removed. `clips` maps url -> local path. Returns the number of
+    clips recovered.
+    """
+    recovered = 0
+
+    for video in videos:
+        path = clips.get(video.get("url"))
+        if video.get("local_path") or not path:
+            continue
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            video["local_path"] = path
+            recovered += 1
+
+    for folder in (download_dir, os.path.join(download_dir, "proxies")):
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if ".part." in name or name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError as e:
+                    print(f"[Journal] Could not remove {name}: {e}")
+
+    return recovered
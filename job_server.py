@@ -0,0 +1,570 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote
+
+from pipeline import PipelineError, PipelineJob, load_api_keys, plan, render
+from audio_analysis import detect_bpm
+from model_scheduler import GB, configure_scheduler, get_scheduler
+from progress_bus import estimate_eta
+from job_journal import read_json, write_json_atomic
+from job_control import CancelToken, JobCancelled
+from resource_config import STAGES, configure_resources, parse_stage_threads
+
+# Job settings accepted from requests and passed through to
+# PipelineJob, with the JSON types each one may take
+JOB_SETTINGS = {
+    "model_name": str,
+    "use_whisper": bool,
+    "whisper_model": str,
+    "stream_alignment": bool,
+    "reuse_alignment": bool,
+    "resolution": str,
+    "subdivision": str,
+    "coalesce": str,
+    "min_shot": (int, float),
+    "library_dirs": list,
+    "trim_fetch": bool,
+    "use_proxies": bool,
+    "proxy_codec": str,
+    "proxy_height": int,
+    "render_preview": bool,
+}
+
+# Files the service itself writes into a job folder; an uploaded
+# audio file may not take their names
+RESERVED_FILENAMES = {
+    "job.json",
+    "journal.json",
+    "LyricVision_Output.fcpxml",
+    "LyricVision_Output_preview.mp4",
+    "media",
+}
+
+
+def _check_type(name, value, types):
+    types = types if isinstance(types, tuple) else (types,)
+    # JSON true/false must not pass as a number (bool subclasses int)
+    if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+        raise ValueError(f"Invalid {name}: {value!r}")
+
+
+def validate_settings(payload):
+    """
+    Job settings taken from a request, type-checked so a bad value is
+    rejected up front instead of failing (or misbehaving) mid-job.
+    """
+    settings = {}
+
+    for name, types in JOB_SETTINGS.items():
+        if name not in payload:
+            continue
+        value = payload[name]
+        _check_type(name, value, types)
+        settings[name] = value
+
+    # A bare string would be iterated as one folder per character
+    if not all(isinstance(d, str) and d for d in settings.get("library_dirs", [])):
+        raise ValueError("library_dirs must be a list of folder paths.")
+
+    return settings
+
+
+def audio_filename(name):
+    """
+    Safe name for an uploaded audio file inside the job folder.
+    """
+    if not isinstance(name, str):
+        raise ValueError(f"Invalid audio_filename: {name!r}")
+
+    filename = os.path.basename(name.replace("\\", "/"))
+    if (
+        not filename
+        or filename.startswith(".")
+        or filename.endswith(".part")
+        or filename in RESERVED_FILENAMES
+    ):
+        raise ValueError(f"Invalid audio_filename: {name!r}")
+
+    return filename
+
+
+def default_jobs_dir():
+    base = os.path.expanduser("~/Library/Application Support/LyricVision/jobs")
+    os.makedirs(base, exist_ok=True)
+    return base
+
+
+class Job:
+
+    def __init__(self, job_id, job_dir, audio_path, lyrics, bpm, settings):
+        self.id = job_id
+        self.dir = job_dir
+        self.audio_path = audio_path
+        self.lyrics = lyrics
+        self.bpm = bpm
+        self.settings = settings
+
+        self.state = "queued"
+        self.stage = None
+        self.message = None
+        self.fraction = None
+        self.error = None
+        self.stages = {}
+        self.created = time.time()
+        self.finished = None
+        self.output_path = None
+        self.cancel = CancelToken()
+
+    def save(self):
+        """
+        Persists the request and outcome to job.json, so jobs survive a
+        restart of the service (see JobService.recover()).
+        """
+        write_json_atomic(os.path.join(self.dir, "job.json"), {
+            "id": self.id,
+            "audio_path": self.audio_path,
+            "lyrics": self.lyrics,
+            "bpm": self.bpm,
+            "settings": self.settings,
+            "state": self.state,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+            "output_path": self.output_path,
+        })
+
+    def on_progress(self, stage, message, fraction=None):
+        if stage != self.stage:
+            self.end_stage()
+            self.stages.setdefault(stage, {"started": time.time(), "finished": None})
+
+        self.stage = stage
+        self.message = message
+        self.fraction = fraction
+
+    def end_stage(self):
+        if self.stage in self.stages:
+            self.stages[self.stage]["finished"] = time.time()
+
+    def eta(self):
+        if self.state != "running" or self.stage not in self.stages:
+            return None
+        return estimate_eta(self.stages[self.stage]["started"], self.fraction, time.time())
+
+    def artifacts(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.dir):
+            for name in filenames:
+                found.append(os.path.relpath(os.path.join(dirpath, name), self.dir))
+        return sorted(found)
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "state": self.state,
+            "stage": self.stage,
+            "message": self.message,
+            "fraction": self.fraction,
+            "eta": self.eta(),
+            "error": self.error,
+            "stages": self.stages,
+            "created": self.created,
+            "finished": self.finished,
+            "artifacts": self.artifacts() if self.state == "done" else [],
+        }
+
+
+class JobService:
+    """
+    Queues pipeline jobs and runs them on a fixed pool of worker threads.
+    Workers share one process, so WhisperX and the align model stay
+    resident across jobs.
+    """
+
+    def __init__(self, jobs_dir=None, workers=1):
+        self.jobs_dir = jobs_dir or default_jobs_dir()
+        self.jobs = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+
+        self.workers = [
+            threading.Thread(target=self._worker, daemon=True)
+            for _ in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+        self.recover()
+
+    def recover(self):
+        """
+        Reloads the jobs saved in jobs_dir. Finished jobs are listed
+        again; jobs that were queued or running when the service went
+        down are queued once more and resume from their journal.
+        """
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            job_dir = os.path.join(self.jobs_dir, job_id)
+            data = read_json(os.path.join(job_dir, "job.json"))
+            if not data:
+                continue
+
+            job = Job(
+                job_id,
+                job_dir,
+                data["audio_path"],
+                data.get("lyrics", ""),
+                data.get("bpm"),
+                data.get("settings") or {}
+            )
+            job.created = data.get("created") or job.created
+
+            with self.lock:
+                self.jobs[job_id] = job
+
+            if data.get("state") in ("done", "failed", "cancelled"):
+                job.state = data["state"]
+                job.error = data.get("error")
+                job.finished = data.get("finished")
+                job.output_path = data.get("output_path")
+            else:
+                print(f"[Jobs] Resuming interrupted job {job_id}")
+                self.queue.put(job)
+
+    def submit(self, payload):
+        # Everything is validated before the job folder is created, so
+        # rejected requests leave nothing behind
+        if not isinstance(payload, dict):
+            raise TypeError("Request body must be a JSON object.")
+
+        audio_data = None
+
+        if payload.get("audio_data"):
+            audio_data = base64.b64decode(payload["audio_data"], validate=True)
+            filename = audio_filename(payload.get("audio_filename") or "audio.wav")
+        elif payload.get("audio_path"):
+            _check_type("audio_path", payload["audio_path"], str)
+            audio_path = os.path.abspath(payload["audio_path"])
+            if not os.path.isfile(audio_path):
+                raise ValueError(f"Audio not found: {audio_path}")
+        else:
+            raise ValueError("Provide audio_path or audio_data.")
+
+        _check_type("lyrics", payload.get("lyrics", ""), str)
+        if payload.get("bpm") is not None:
+            _check_type("bpm", payload["bpm"], (int, float))
+
+        settings = validate_settings(payload)
+
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+
+        if audio_data is not None:
+            audio_path = os.path.join(job_dir, filename)
+            with open(audio_path, "wb") as f:
+                f.write(audio_data)
+
+        job = Job(
+            job_id,
+            job_dir,
+            audio_path,
+            payload.get("lyrics", ""),
+            payload.get("bpm"),
+            settings
+        )
+
+        job.save()
+
+        with self.lock:
+            self.jobs[job_id] = job
+
+        self.queue.put(job)
+        return job
+
+    def retry(self, job_id):
+        """
+        Queues a failed or cancelled job again; it resumes after the
+        stages its journal records as finished.
+        """
+        # Checked and requeued under the lock so two concurrent retries
+        # cannot both queue the job
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state not in ("failed", "cancelled"):
+                raise ValueError(f"Job {job_id} is {job.state}, only failed or cancelled jobs can be retried.")
+
+            job.state = "queued"
+            job.error = None
+            job.finished = None
+            job.cancel = CancelToken()
+            job.save()
+
+            self.queue.put(job)
+
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job, or stops a running one at its next check:
+        Demucs and ffmpeg processes are killed and downloads aborted.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.state not in ("queued", "running"):
+            raise ValueError(f"Job {job_id} is {job.state}, only queued or running jobs can be cancelled.")
+
+        job.cancel.cancel()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            try:
+                self._run(job)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, job):
+        if job.cancel.cancelled:
+            job.state = "cancelled"
+            job.finished = time.time()
+            job.save()
+            return
+
+        job.state = "running"
+        job.save()
+        pipeline_job = None
+
+        try:
+            bpm = job.bpm
+            if not bpm:
+                job.on_progress("setup", "Detecting BPM...")
+                bpm = detect_bpm(job.audio_path)
+
+            pipeline_job = PipelineJob(
+                audio_path=job.audio_path,
+                bpm=float(bpm),
+                lyrics=job.lyrics,
+                keys=load_api_keys(),
+                journal_path=os.path.join(job.dir, "journal.json"),
+                cancel=job.cancel,
+                **job.settings
+            )
+
+            plan(pipeline_job, progress=job.on_progress)
+
+            job.output_path = os.path.join(job.dir, "LyricVision_Output.fcpxml")
+            render(pipeline_job, job.output_path, progress=job.on_progress)
+
+            job.state = "done"
+
+        except JobCancelled:
+            job.state = "cancelled"
+
+        except PipelineError as e:
+            job.state = "failed"
+            job.error = f"{e.title}: {e.message}"
+
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+
+        finally:
+            if pipeline_job is not None:
+                pipeline_job.close()
+            job.end_stage()
+            job.finished = time.time()
+            job.save()
+
+            if job.state == "cancelled":
+                # Models the abandoned job loaded are not needed now
+                get_scheduler().unload_all()
+
+
+# =====================================================
+# HTTP
+# =====================================================
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs                        submit a job (JSON body)
+    POST /jobs/<id>/retry             resume a failed or cancelled job
+    POST /jobs/<id>/cancel            cancel a queued or running job
+    GET  /jobs                        list jobs
+    GET  /jobs/<id>                   status and per-stage progress
+    GET  /jobs/<id>/artifacts/<path>  download an output file
+    """
+
+    service = None
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _parts(self):
+        return [unquote(p) for p in urlsplit(self.path).path.split("/") if p]
+
+    def do_POST(self):
+        parts = self._parts()
+
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] in ("retry", "cancel"):
+            action = self.service.retry if parts[2] == "retry" else self.service.cancel
+            try:
+                job = action(parts[1])
+            except ValueError as e:
+                return self._send_json(409, {"error": str(e)})
+            if not job:
+                return self._send_json(404, {"error": "Unknown job"})
+            return self._send_json(202, job.as_dict())
+
+        if parts != ["jobs"]:
+            return self._send_json(404, {"error": "Not found"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Request body must be a JSON object.")
+            job = self.service.submit(payload)
+        except (ValueError, TypeError) as e:
+            return self._send_json(400, {"error": str(e)})
+
+        self._send_json(202, job.as_dict())
+
+    def do_GET(self):
+        parts = self._parts()
+
+        if parts == ["jobs"]:
+            return self._send_json(200, [j.as_dict() for j in self.service.list()])
+
+        if len(parts) < 2 or parts[0] != "jobs":
+            return self._send_json(404, {"error": "Not found"})
+
+        job = self.service.get(parts[1])
+        if not job:
+            return self._send_json(404, {"error": "Unknown job"})
+
+        if len(parts) == 2:
+            return self._send_json(200, job.as_dict())
+
+        if parts[2] == "artifacts" and len(parts) > 3:
+            return self._send_artifact(job, os.path.join(*parts[3:]))
+
+        self._send_json(404, {"error": "Not found"})
+
+    def _send_artifact(self, job, rel_path):
+        root = os.path.realpath(job.dir)
+        path = os.path.realpath(os.path.join(root, rel_path))
+
+        # Refuse anything that resolves outside the job folder
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return self._send_json(404, {"error": "No such artifact"})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header(
+            "Content-Disposition",
+            f'attachment; filename="{os.path.basename(path)}"'
+        )
+        self.end_headers()
+
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+
+def serve(
+    host="127.0.0.1",
+    port=8765,
+    workers=1,
+    jobs_dir=None,
+    memory_gb=None,
+    threads=None,
+    stage_threads=None
+):
+    resources = configure_resources(workers=workers, total_threads=threads, stage_threads=stage_threads)
+    print(f"Thread budget: {resources.as_dict()}")
+
+    if memory_gb:
+        configure_scheduler(int(memory_gb * GB))
+
+    JobRequestHandler.service = JobService(jobs_dir=jobs_dir, workers=workers)
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+
+    print(f"LyricVision job service on http://{host}:{port} ({workers} worker(s))")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LyricVision local job service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--jobs-dir", default=None)
+    parser.add_argument(
+        "--memory-gb",
+        type=float,
+        default=None,
+        help="Memory budget for resident models and stages (default: 75%% of RAM)"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="CPU threads shared by all workers (default: all cores)"
+    )
+    parser.add_argument(
+        "--stage-threads",
+        nargs="*",
+        default=[],
+        metavar="STAGE=N",
+        help=f"Cap a stage's threads per worker, e.g. whisper=4 (stages: {', '.join(STAGES)})"
+    )
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        stage_threads = parse_stage_threads(args.stage_threads)
+    except ValueError as e:
+        parser.error(str(e))
+
+    serve(
+        args.host,
+        args.port,
+        args.workers,
+        args.jobs_dir,
+        args.memory_gb,
+        args.threads,
+        stage_threads
+    )
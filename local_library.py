@@ -0,0 +1,268 @@
+import os
+import re
+import sys
+import json
+import sqlite3
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from typing import List, Dict
+
+from ffmpeg_utils import get_ffmpeg_path
+from media_probe import get_cache_dir, file_hash, probe_cached
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".mkv", ".avi", ".mxf", ".webm"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clips (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    duration REAL,
+    fps TEXT,
+    width INTEGER,
+    height INTEGER,
+    codec TEXT,
+    thumbnail TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS clips_fts USING fts5(path UNINDEXED, tags);
+"""
+
+
+def default_db_path():
+    return os.path.join(get_cache_dir("library"), "library.db")
+
+
+def _tokens(text):
+    return [t for t in re.split(r"[^a-z]+", text.lower()) if len(t) > 1]
+
+
+def read_tags(path, root=None):
+    """
+    Tags for a clip: words from its filename and parent folders (below
+    the library root), plus an optional sidecar file next to it -
+    clip.txt with free text, or clip.json with "tags"/"keywords".
+    """
+    base, _ = os.path.splitext(path)
+    rel_dir = os.path.relpath(os.path.dirname(path), root) if root else ""
+
+    tags = _tokens(os.path.basename(base))
+    if rel_dir not in ("", "."):
+        tags += _tokens(rel_dir)
+
+    if os.path.exists(base + ".txt"):
+        with open(base + ".txt", encoding="utf-8", errors="ignore") as f:
+            tags += _tokens(f.read())
+
+    if os.path.exists(base + ".json"):
+        try:
+            with open(base + ".json", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            for field in ("tags", "keywords", "description"):
+                value = sidecar.get(field)
+                if isinstance(value, list):
+                    value = " ".join(map(str, value))
+                if value:
+                    tags += _tokens(str(value))
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"[Library] Bad sidecar {base}.json: {e}")
+
+    return " ".join(dict.fromkeys(tags))
+
+
+def extract_thumbnail(path, duration=None):
+    """
+    Grabs one keyframe from the middle of the clip into the thumbnail
+    cache. Returns the thumbnail path.
+    """
+    thumb_path = os.path.join(get_cache_dir("thumbnails"), f"{file_hash(path)}.jpg")
+
+    if os.path.exists(thumb_path):
+        return thumb_path
+
+    seek = (duration or 0) / 2
+
+    command = [
+        get_ffmpeg_path(),
+        "-y",
+        "-ss", f"{seek:.2f}",
+        "-i", path,
+        "-frames:v", "1",
+        "-vf", "scale=320:-2",
+        thumb_path
+    ]
+
+    subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return thumb_path
+
+
+class LocalLibrary:
+    """
+    Offline search provider over footage directories we already own.
+    Clip metadata and tags live in a SQLite full-text index; search()
+    returns the same result dicts as VideoSearch with local_path filled.
+    """
+
+    def __init__(self, directories: List[str] = None, db_path=None, max_workers=4):
+        self.directories = list(directories or [])
+        self.db_path = db_path or default_db_path()
+        self.max_workers = max_workers
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path)
+
+    def _scope(self, column="path"):
+        """
+        SQL condition (and its parameters) matching paths under this
+        library's directories. The index is shared by every library, so
+        scans and searches stay inside their own folders.
+        """
+        prefixes = [os.path.join(os.path.abspath(root), "") for root in self.directories]
+
+        if not prefixes:
+            return "0", []
+
+        # An exact prefix compare: LIKE would fold case and treat '_'
+        # and '%' in folder names as wildcards
+        clause = " OR ".join(f"substr({column}, 1, ?) = ?" for _ in prefixes)
+        params = [value for prefix in prefixes for value in (len(prefix), prefix)]
+        return f"({clause})", params
+
+    # ======================================================
+    # SCAN
+    # ======================================================
+
+    def _walk(self):
+        for root in self.directories:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                        yield root, os.path.abspath(os.path.join(dirpath, name))
+
+    def scan(self) -> int:
+        """
+        Indexes new and modified clips under the library directories and
+        drops their entries whose files are gone; clips indexed for other
+        directories are left alone. Returns the number of clips
+        (re)indexed.
+        """
+        scope, params = self._scope()
+
+        with self._connect() as conn:
+            known = {
+                path: (mtime, size)
+                for path, mtime, size in conn.execute(
+                    f"SELECT path, mtime, size FROM clips WHERE {scope}", params
+                )
+            }
+
+        found = set()
+        pending = []
+
+        for root, path in self._walk():
+            found.add(path)
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_mtime, stat.st_size):
+                pending.append((root, path, stat))
+
+        def _index(item):
+            root, path, stat = item
+            try:
+                info = probe_cached(path)
+                thumbnail = None
+                try:
+                    thumbnail = extract_thumbnail(path, info.get("duration"))
+                except Exception as e:
+                    print(f"[Library] No thumbnail for {path}: {e}")
+                return path, stat, info, thumbnail, read_tags(path, root)
+            except Exception as e:
+                print(f"[Library] Skipping {path}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            rows = [r for r in pool.map(_index, pending) if r]
+
+        with self._connect() as conn:
+            for path, stat, info, thumbnail, tags in rows:
+                conn.execute(
+                    "INSERT OR REPLACE INTO clips VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        path, stat.st_mtime, stat.st_size,
+                        info.get("duration"),
+                        str(info["fps"]) if info.get("fps") else None,
+                        info.get("width"), info.get("height"),
+                        info.get("codec"), thumbnail,
+                    )
+                )
+                conn.execute("DELETE FROM clips_fts WHERE path = ?", (path,))
+                conn.execute("INSERT INTO clips_fts (path, tags) VALUES (?, ?)", (path, tags))
+
+            for path in set(known) - found:
+                conn.execute("DELETE FROM clips WHERE path = ?", (path,))
+                conn.execute("DELETE FROM clips_fts WHERE path = ?", (path,))
+
+        return len(rows)
+
+    # ======================================================
+    # SEARCH
+    # ======================================================
+
+    def search(self, keywords: List[str], per_query: int = 2) -> List[Dict]:
+        results = []
+        seen = set()
+        scope, scope_params = self._scope("c.path")
+
+        with self._connect() as conn:
+            for keyword in keywords:
+                terms = _tokens(str(keyword))
+                if not terms:
+                    continue
+
+                # All words must match; quoting keeps FTS syntax out
+                query = " ".join(f'"{t}"' for t in terms)
+
+                rows = conn.execute(
+                    """
+                    SELECT c.path, c.duration, c.fps, c.width, c.height, c.codec, c.thumbnail
+                    FROM clips_fts f JOIN clips c ON c.path = f.path
+                    WHERE clips_fts MATCH ? AND {scope}
+                    ORDER BY bm25(clips_fts)
+                    LIMIT ?
+                    """.format(scope=scope),
+                    (query, *scope_params, per_query)
+                ).fetchall()
+
+                for path, duration, fps, width, height, codec, thumbnail in rows:
+                    if path in seen or not os.path.exists(path):
+                        continue
+                    seen.add(path)
+
+                    results.append({
+                        "source": "Local",
+                        "keyword_query": keyword,
+                        "url": f"file://{path}",
+                        "preview": thumbnail,
+                        "user": "Local Library",
+                        "duration": duration,
+                        "width": width,
+                        "height": height,
+                        "local_path": path,
+                        "probe": {
+                            "duration": duration,
+                            "fps": Fraction(fps) if fps else None,
+                            "width": width,
+                            "height": height,
+                            "codec": codec,
+                        },
+                    })
+
+        return results
+
+
+if __name__ == "__main__":
+    # python local_library.py /footage/dir [...]  -> (re)build the index
+    library = LocalLibrary(sys.argv[1:])
+    print(f"Indexed {library.scan()} clips into {library.db_path}")
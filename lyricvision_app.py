@@ -1,44 +1,31 @@
 import os
-
-# ==========================================
-# SAFETY: Force CPU + MPS fallback
-# ==========================================
-os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
-os.environ["CUDA_VISIBLE_DEVICES"] = ""
-
+import queue
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import webbrowser
 import keyring
-import torch
 from subtitle_export import export_srt
 
-# ==========================================
-# Torch load override (PyTorch 2.6+ fix)
-# ==========================================
-_original_torch_load = torch.load
-
-
-def patched_torch_load(*args, **kwargs):
-    kwargs["weights_only"] = False
-    return _original_torch_load(*args, **kwargs)
-
-
-torch.load = patched_torch_load
-
 # ==========================================
 # Internal Imports
 # ==========================================
-from whisper_align import transcribe_with_word_timestamps
-from demucs_utils import separate_vocals
-from nlp_utils import extract_keywords
-from video_search import VideoSearch
+from pipeline import (
+    APP_NAME,
+    PipelineError,
+    PipelineJob,
+    load_api_keys,
+    plan,
+    render,
+)
 from audio_analysis import detect_bpm
-from timeline_builder import build_word_level_timeline
-from davinci_export import export_fcpxml
+from proxy_utils import PROXY_CODECS
+from timeline_builder import COALESCE_POLICIES
+from progress_bus import ProgressBus, format_eta
+from job_control import JobActive, JobCancelled, JobHandle
 
-APP_NAME = "LyricVision"
+# How often the Tk loop applies queued progress, i.e. the redraw cap
+POLL_INTERVAL_MS = 100
 
 
 class LyricVisionApp:
@@ -50,8 +37,14 @@ class LyricVisionApp:
         self.audio_path = None
         self.bpm = None
         self.word_timestamps = []
+        self.library_dirs = []
+
+        self.progress_bus = ProgressBus()
+        self.ui_calls = queue.Queue()
+        self.active_job = None
 
         self.build_ui()
+        self.root.after(POLL_INTERVAL_MS, self._poll)
 
     # =====================================================
     # UI
@@ -78,7 +71,8 @@ class LyricVisionApp:
             "gpt-4.1-mini",
             "gpt-4.1-mini",
             "gpt-4o",
-            "gemini-3-flash-preview"
+            "gemini-3-flash-preview",
+            "local"
         ).pack()
 
         ttk.Button(self.root, text="Manage API Keys",
@@ -123,6 +117,81 @@ class LyricVisionApp:
             "4K"
         ).pack()
 
+        # Local footage library
+        library_frame = ttk.Frame(self.root)
+        library_frame.pack(pady=5)
+
+        ttk.Button(
+            library_frame,
+            text="Add Footage Folder",
+            command=self.add_library_dir
+        ).grid(row=0, column=0, padx=5)
+
+        self.library_label = ttk.Label(library_frame, text="No local library")
+        self.library_label.grid(row=0, column=1, padx=5)
+
+        # Trimmed fetch
+        self.trim_fetch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.root,
+            text="Fetch Only Used Portion of Clips",
+            variable=self.trim_fetch_var
+        ).pack(pady=5)
+
+        # Alignment reuse
+        self.reuse_alignment_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            self.root,
+            text="Reuse Alignment From Other Versions of the Song",
+            variable=self.reuse_alignment_var
+        ).pack(pady=5)
+
+        # Streaming alignment
+        self.stream_alignment_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.root,
+            text="Stream Alignment (show progress per chunk)",
+            variable=self.stream_alignment_var
+        ).pack(pady=5)
+
+        # Preview
+        self.render_preview_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            self.root,
+            text="Render Preview MP4",
+            variable=self.render_preview_var
+        ).pack(pady=5)
+
+        # Proxies
+        proxy_frame = ttk.Frame(self.root)
+        proxy_frame.pack(pady=5)
+
+        self.use_proxies_var = tk.BooleanVar(value=False)
+        self.proxy_codec_var = tk.StringVar(value="h264")
+        self.proxy_height_var = tk.StringVar(value="540")
+
+        ttk.Checkbutton(
+            proxy_frame,
+            text="Generate Proxy Media",
+            variable=self.use_proxies_var
+        ).grid(row=0, column=0, padx=5)
+
+        ttk.OptionMenu(
+            proxy_frame,
+            self.proxy_codec_var,
+            "h264",
+            *PROXY_CODECS.keys()
+        ).grid(row=0, column=1, padx=5)
+
+        ttk.OptionMenu(
+            proxy_frame,
+            self.proxy_height_var,
+            "540",
+            "360",
+            "540",
+            "720"
+        ).grid(row=0, column=2, padx=5)
+
         # Subdivision
         ttk.Label(self.root, text="Beat Subdivision").pack(pady=(10, 0))
         self.subdivision_var = tk.StringVar(value="quarter")
@@ -136,15 +205,57 @@ class LyricVisionApp:
             "sixteenth"
         ).pack()
 
+        # Coalescing
+        ttk.Label(self.root, text="Clip Grouping / Minimum Shot (s)").pack(pady=(10, 0))
+        coalesce_frame = ttk.Frame(self.root)
+        coalesce_frame.pack(pady=5)
+
+        self.coalesce_var = tk.StringVar(value="word")
+        self.min_shot_var = tk.StringVar(value="0")
+
+        ttk.OptionMenu(
+            coalesce_frame,
+            self.coalesce_var,
+            "word",
+            *COALESCE_POLICIES
+        ).grid(row=0, column=0, padx=5)
+
+        ttk.OptionMenu(
+            coalesce_frame,
+            self.min_shot_var,
+            "0",
+            "0",
+            "0.5",
+            "1",
+            "2"
+        ).grid(row=0, column=1, padx=5)
+
+        run_frame = ttk.Frame(self.root)
+        run_frame.pack(pady=20)
+
         ttk.Button(
-            self.root,
+            run_frame,
             text="Generate Video Plan",
             command=self.run_pipeline
-        ).pack(pady=20)
+        ).grid(row=0, column=0, padx=5)
+
+        ttk.Button(
+            run_frame,
+            text="Cancel",
+            command=self.cancel_pipeline
+        ).grid(row=0, column=1, padx=5)
 
         self.status_label = ttk.Label(self.root, text="Idle")
         self.status_label.pack()
 
+        self.progress_bar = ttk.Progressbar(
+            self.root,
+            mode="determinate",
+            maximum=100,
+            length=400
+        )
+        self.progress_bar.pack(pady=5)
+
         ttk.Button(
             self.root,
             text="Export Beat-Snapped Subtitles (.srt)",
@@ -188,224 +299,236 @@ class LyricVisionApp:
     # =====================================================
 
     def load_audio(self):
-        self.audio_path = filedialog.askopenfilename(
+        audio_path = filedialog.askopenfilename(
             filetypes=[("Audio", "*.wav *.mp3 *.flac *.m4a")]
         )
 
-        if not self.audio_path:
+        if not audio_path:
             return
 
-        self.update_status("Detecting BPM...")
+        self.audio_path = audio_path
+        self.bpm = None
+        self._bpm_status("status", "Detecting BPM...")
+
+        threading.Thread(
+            target=self._detect_bpm_thread,
+            args=(audio_path,),
+            daemon=True
+        ).start()
 
+    def _detect_bpm_thread(self, audio_path):
         try:
-            detected_bpm = detect_bpm(self.audio_path)
-            self.bpm = float(detected_bpm)
-            self.manual_bpm_var.set(str(round(self.bpm, 2)))
-            messagebox.showinfo("BPM Detected",
-                                f"Detected BPM: {round(self.bpm, 2)}")
+            bpm = float(detect_bpm(audio_path))
         except Exception as e:
-            messagebox.showerror("BPM Error", str(e))
-            self.bpm = None
+            error = str(e)
+            self._call_in_ui(lambda: messagebox.showerror("BPM Error", error))
+            self._bpm_status("idle", "Idle")
+            return
+
+        def _apply():
+            # A newer import may have replaced this file meanwhile
+            if self.audio_path != audio_path:
+                return
+            self.bpm = bpm
+            self.manual_bpm_var.set(str(round(bpm, 2)))
+            messagebox.showinfo("BPM Detected", f"Detected BPM: {round(bpm, 2)}")
+
+        self._call_in_ui(_apply)
+        self._bpm_status("idle", "Idle")
+
+    def _bpm_status(self, stage, text):
+        # A running job owns the status line and progress bar; BPM
+        # detection only reports through its dialogs then
+        if self.active_job and self.active_job.running:
+            return
+        self.progress_bus(stage, text)
+
+    def add_library_dir(self):
+        path = filedialog.askdirectory()
+
+        if not path or path in self.library_dirs:
+            return
+
+        self.library_dirs.append(path)
+        self.library_label.config(
+            text=f"{len(self.library_dirs)} local folder(s)"
+        )
 
     # =====================================================
     # PIPELINE
     # =====================================================
 
     def run_pipeline(self):
-        threading.Thread(target=self._pipeline_thread, daemon=True).start()
+        if self.active_job and self.active_job.running:
+            if messagebox.askyesno(
+                "Busy",
+                "A run is in progress. Stop it and start again with the current settings?"
+            ):
+                self.cancel_pipeline()
+                self._run_when_stopped()
+            return
 
-    def _pipeline_thread(self):
-        try:
+        # Everything that needs the UI is collected here, on the Tk
+        # thread; the worker only gets plain values
+        bpm = self.bpm
 
-            if not self.audio_path:
-                self._safe_msg("Missing Audio", "Please import audio first.")
+        if self.use_manual_bpm_var.get():
+            try:
+                bpm = float(self.manual_bpm_var.get())
+            except ValueError:
+                messagebox.showinfo("Invalid BPM", "Enter valid BPM.")
                 return
 
-            if self.use_manual_bpm_var.get():
-                try:
-                    self.bpm = float(self.manual_bpm_var.get())
-                except ValueError:
-                    self._safe_msg("Invalid BPM", "Enter valid BPM.")
-                    return
+        if not self.audio_path:
+            messagebox.showinfo("Missing Audio", "Please import audio first.")
+            return
 
-            if not self.bpm:
-                self._safe_msg("Missing BPM", "Provide or detect BPM first.")
-                return
+        save_path = filedialog.asksaveasfilename(
+            defaultextension=".fcpxml",
+            filetypes=[("Final Cut XML", "*.fcpxml")]
+        )
 
-            self.update_status(f"Using BPM: {self.bpm}")
-
-            # ===============================
-            # WHISPERX + OPTIONAL DEMUCS
-            # ===============================
-
-            if self.use_whisper_var.get():
-
-                raw_lyrics = self.lyrics_box.get("1.0", tk.END).strip()
-
-                try:
-                    # ---- Decide whether to run Demucs ----
-                    if "acapella" in self.audio_path.lower():
-                        vocals_path = self.audio_path
-                    else:
-                        stems_dir = os.path.join(
-                            os.path.dirname(self.audio_path),
-                            "stems"
-                        )
-                        os.makedirs(stems_dir, exist_ok=True)
-
-                        self.update_status("Separating vocals with Demucs...")
-                        vocals_path = separate_vocals(
-                            self.audio_path,
-                            stems_dir
-                        )
-
-                except Exception as e:
-                    self._safe_msg("Demucs Error", str(e))
-                    return
-
-                # ---- Run WhisperX ----
-                self.update_status("Running WhisperX alignment...")
-
-                try:
-                    if raw_lyrics:
-                        self.word_timestamps = transcribe_with_word_timestamps(
-                            vocals_path,
-                            lyrics=raw_lyrics
-                        )
-                    else:
-                        self.word_timestamps = transcribe_with_word_timestamps(
-                            vocals_path
-                        )
-
-                except Exception as e:
-                    self._safe_msg("WhisperX Error", str(e))
-                    return
-
-                if not self.word_timestamps:
-                    self._safe_msg(
-                        "Alignment Error",
-                        "No word timestamps generated."
-                    )
-                    return
-
-            # =================================================
-            # KEYWORDS
-            # =================================================
-
-            self.update_status("Extracting keywords...")
-
-            model_name = self.model_var.get()
-            openai_key = keyring.get_password(APP_NAME, "openai")
-            gemini_key = keyring.get_password(APP_NAME, "gemini")
-
-            lines = [
-                l.strip()
-                for l in self.lyrics_box.get("1.0", tk.END).split("\n")
-                if l.strip()
-            ]
-
-            keywords = []
-
-            if model_name.startswith("gpt"):
-                if not openai_key:
-                    self._safe_msg("Missing OpenAI Key", "Add your OpenAI key.")
-                    return
-                for line in lines:
-                    keywords += extract_keywords(line, openai_key=openai_key)
-
-            elif model_name.startswith("gemini"):
-                if not gemini_key:
-                    self._safe_msg("Missing Gemini Key", "Add your Gemini key.")
-                    return
-                for line in lines:
-                    keywords += extract_keywords(line, gemini_key=gemini_key)
-
-            if not keywords:
-                keywords = [w["word"] for w in self.word_timestamps]
-
-            # =================================================
-            # VIDEO SEARCH
-            # =================================================
-
-            self.update_status("Searching stock videos...")
-
-            searcher = VideoSearch(
-                keyring.get_password(APP_NAME, "pexels"),
-                keyring.get_password(APP_NAME, "pixabay"),
-                resolution=self.resolution_var.get()
-            )
-
-            videos = searcher.search(keywords, per_query=6)
-
-            if not videos:
-                self._safe_msg("No Videos Found", "Try different keywords.")
-                return
+        if not save_path:
+            return
 
-            # =================================================
-            # TIMELINE
-            # =================================================
+        job = PipelineJob(
+            audio_path=self.audio_path,
+            bpm=bpm,
+            lyrics=self.lyrics_box.get("1.0", tk.END),
+            model_name=self.model_var.get(),
+            use_whisper=self.use_whisper_var.get(),
+            word_timestamps=self.word_timestamps,
+            resolution=self.resolution_var.get(),
+            subdivision=self.subdivision_var.get(),
+            coalesce=self.coalesce_var.get(),
+            min_shot=float(self.min_shot_var.get()),
+            library_dirs=self.library_dirs,
+            trim_fetch=self.trim_fetch_var.get(),
+            use_proxies=self.use_proxies_var.get(),
+            proxy_codec=self.proxy_codec_var.get(),
+            proxy_height=int(self.proxy_height_var.get()),
+            render_preview=self.render_preview_var.get(),
+            stream_alignment=self.stream_alignment_var.get(),
+            reuse_alignment=self.reuse_alignment_var.get(),
+            # Exporting to the same path again after a crash resumes
+            journal_path=os.path.splitext(save_path)[0] + ".journal.json"
+        )
 
-            timeline = build_word_level_timeline(
-                words=self.word_timestamps,
-                bpm=self.bpm,
-                subdivision=self.subdivision_var.get()
-            )
+        # One run per output folder: they share the media it downloads
+        handle = JobHandle(os.path.dirname(save_path), self._pipeline_thread, job, save_path)
+        job.cancel = handle.cancel_token
 
-            if not timeline:
-                self._safe_msg("Timeline Error", "Timeline is empty.")
-                return
+        try:
+            handle.start()
+        except JobActive as e:
+            messagebox.showinfo("Busy", str(e))
+            return
 
-            # =================================================
-            # SAVE
-            # =================================================
+        self.progress_bus.reset()
+        self.active_job = handle
 
-            save_path = filedialog.asksaveasfilename(
-                defaultextension=".fcpxml",
-                filetypes=[("Final Cut XML", "*.fcpxml")]
-            )
+    def cancel_pipeline(self):
+        if self.active_job and self.active_job.running:
+            self.active_job.cancel()
+            self.update_status("Cancelling...")
 
-            if not save_path:
-                return
+    def _run_when_stopped(self):
+        if self.active_job and self.active_job.running:
+            self.root.after(POLL_INTERVAL_MS, self._run_when_stopped)
+            return
+        self.run_pipeline()
 
-            media_dir = os.path.join(
-                os.path.dirname(save_path),
-                "media"
-            )
+    def _pipeline_thread(self, cancel, job, save_path):
+        progress = self.progress_bus
+        status = "Idle"
 
-            self.update_status("Downloading clips...")
-            videos = searcher.download_videos(videos, media_dir)
-            videos = [v for v in videos if v.get("local_path")]
+        try:
+            job.keys = load_api_keys()
 
-            if not videos:
-                self._safe_msg("Download Failed", "No videos downloaded.")
-                return
+            if not job.bpm:
+                # Import-time detection still running or failed
+                progress("setup", "Detecting BPM...")
+                job.bpm = float(detect_bpm(job.audio_path))
+                self.bpm = job.bpm
+                cancel.check()
+
+            plan(job, progress=progress)
+            self.word_timestamps = job.word_timestamps
 
-            self.update_status("Exporting FCPXML...")
+            render(job, save_path, progress=progress)
 
-            export_fcpxml(
-                videos=videos,
-                timeline=timeline,
-                resolution=self.resolution_var.get(),
-                output_path=save_path
-            )
+            message = f"Exported to:\n{save_path}"
+            if job.preview_path:
+                message += f"\n\nPreview:\n{job.preview_path}"
 
-            self._safe_msg("Success", f"Exported to:\n{save_path}")
+            self._safe_msg("Success", message)
+
+        except JobCancelled:
+            # The journal is kept, so the same export path resumes
+            status = "Cancelled"
+
+        except PipelineError as e:
+            self._safe_msg(e.title, e.message)
 
         except Exception as e:
             self._safe_msg("Error", str(e))
 
         finally:
-            self.update_status("Idle")
+            job.close()
+            progress("idle", status)
 
     # =====================================================
     # UI Helpers
     # =====================================================
 
+    def _call_in_ui(self, fn):
+        # Tk is not thread-safe; workers queue calls for _poll to run
+        self.ui_calls.put(fn)
+
     def _safe_msg(self, title, message):
-        self.root.after(0, lambda: messagebox.showinfo(title, message))
+        self._call_in_ui(lambda: messagebox.showinfo(title, message))
 
     def update_status(self, text):
-        self.root.after(0, lambda: self.status_label.config(text=text))
+        self.progress_bus("status", text)
+
+    def _poll(self):
+        """
+        Runs on the Tk loop every POLL_INTERVAL_MS: applies the newest
+        progress event and any queued UI calls, so the window stays
+        responsive however often workers report.
+        """
+        events = self.progress_bus.drain()
+
+        if events:
+            event = events[-1]
+            text = event.message
+
+            if event.fraction is not None:
+                text += f"  {event.fraction:.0%}"
+            if event.eta is not None:
+                text += f"  (about {format_eta(event.eta)} left)"
+
+            self.status_label.config(text=text)
+
+            if event.stage == "idle":
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate", value=0)
+            elif event.fraction is None:
+                if self.progress_bar.cget("mode") != "indeterminate":
+                    self.progress_bar.config(mode="indeterminate")
+                    self.progress_bar.start(15)
+            else:
+                self.progress_bar.stop()
+                self.progress_bar.config(mode="determinate", value=event.fraction * 100)
+
+        while True:
+            try:
+                fn = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            fn()
+
+        self.root.after(POLL_INTERVAL_MS, self._poll)
 
         # =====================================================
         # Export subs
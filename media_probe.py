@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from typing import List, Dict
+
+from ffmpeg_utils import get_ffprobe_path
+
+# Bytes read from the head and tail of a file when hashing it.
+HASH_SAMPLE_BYTES = 1024 * 1024
+
+# Read size when hashing a whole file
+HASH_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def get_cache_dir(name):
+    base = os.path.expanduser(
+        os.path.join("~/Library/Application Support/LyricVision/cache", name)
+    )
+    os.makedirs(base, exist_ok=True)
+    return base
+
+
+def file_hash(path):
+    """
+    Content hash used as a cache key for media files.
+    Hashes the size plus the first and last megabyte, which is enough
+    to tell stock clips apart without reading multi-GB files in full.
+    """
+    size = os.path.getsize(path)
+    h = hashlib.sha1(str(size).encode())
+
+    with open(path, "rb") as f:
+        h.update(f.read(HASH_SAMPLE_BYTES))
+        if size > HASH_SAMPLE_BYTES:
+            f.seek(max(HASH_SAMPLE_BYTES, size - HASH_SAMPLE_BYTES))
+            h.update(f.read(HASH_SAMPLE_BYTES))
+
+    return h.hexdigest()
+
+
+# (path, size, mtime) -> content hash; a job hashes its song several times
+_content_hashes = {}
+
+
+def content_hash(path):
+    """
+    Hash of a file's full content, for audio identity. file_hash()
+    would confuse same-length edits of a song (clean and explicit
+    versions differ only in the middle); songs are small enough to
+    read whole. Cached per process until the file changes.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    cached = _content_hashes.get(key)
+    if cached:
+        return cached
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+
+    _content_hashes[key] = h.hexdigest()
+    return _content_hashes[key]
+
+
+# =========================================
+# FFPROBE
+# =========================================
+
+def _parse_rate(rate):
+    try:
+        value = Fraction(rate)
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+    return value if value > 0 else None
+
+
+def probe_video(path):
+    """
+    Returns duration (seconds), fps (Fraction), width, height and codec
+    for the first video stream of the given file.
+    """
+    command = [
+        get_ffprobe_path(),
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries",
+        "stream=codec_name,width,height,r_frame_rate,avg_frame_rate,duration"
+        ":format=duration",
+        "-of", "json",
+        path
+    ]
+
+    proc = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    data = json.loads(proc.stdout or b"{}")
+
+    streams = data.get("streams") or []
+    if not streams:
+        raise ValueError(f"No video stream in {path}")
+
+    stream = streams[0]
+
+    fps = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate"))
+
+    duration = stream.get("duration") or data.get("format", {}).get("duration")
+
+    return {
+        "duration": float(duration) if duration else None,
+        "fps": fps,
+        "width": int(stream.get("width", 0)) or None,
+        "height": int(stream.get("height", 0)) or None,
+        "codec": stream.get("codec_name"),
+    }
+
+
+def _load_cached(key):
+    cache_path = os.path.join(get_cache_dir("probe"), f"{key}.json")
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with open(cache_path) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if info.get("fps"):
+        info["fps"] = Fraction(info["fps"])
+    return info
+
+
+def _store_cached(key, info):
+    cache_path = os.path.join(get_cache_dir("probe"), f"{key}.json")
+    data = dict(info)
+    if data.get("fps") is not None:
+        data["fps"] = str(data["fps"])
+
+    with open(cache_path, "w") as f:
+        json.dump(data, f)
+
+
+def probe_cached(path):
+    key = file_hash(path)
+
+    info = _load_cached(key)
+    if info is None:
+        info = probe_video(path)
+        _store_cached(key, info)
+
+    return info
+
+
+def probe_videos(videos: List[Dict], max_workers=4, on_progress=None) -> List[Dict]:
+    """
+    Probes every downloaded clip in parallel and stores the result
+    under video["probe"]. Clips that fail to probe keep their
+    provider metadata. on_progress(done, total) follows completion.
+    """
+    targets = [v for v in videos if v.get("local_path")]
+
+    def _probe(video):
+        try:
+            video["probe"] = probe_cached(video["local_path"])
+        except Exception as e:
+            print(f"[Probe Error] {video['local_path']}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for done, _ in enumerate(pool.map(_probe, targets), 1):
+            if on_progress:
+                on_progress(done, len(targets))
+
+    return videos
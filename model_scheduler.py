@@ -0,0 +1,241 @@
+import os
+import gc
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+GB = 1024 ** 3
+
+# Approximate resident footprint of each model on CPU, in bytes
+MODEL_FOOTPRINTS = {
+    "whisper:large-v3": int(3.1 * GB),
+    "whisper:large-v2": int(3.1 * GB),
+    "whisper:medium": int(1.6 * GB),
+    "whisper:small": int(0.6 * GB),
+    "whisper:base": int(0.3 * GB),
+    "whisper:tiny": int(0.2 * GB),
+    "align": int(1.3 * GB),
+    "htdemucs": int(3.0 * GB),
+}
+
+DEFAULT_FOOTPRINT = int(1.0 * GB)
+
+# Share of physical RAM the scheduler hands out by default
+DEFAULT_BUDGET_FRACTION = 0.75
+
+
+def footprint_for(name):
+    # Most specific known prefix wins, e.g. "whisper:small:int8" ->
+    # "whisper:small", "align:en" -> "align"
+    parts = name.split(":")
+    for i in range(len(parts), 0, -1):
+        key = ":".join(parts[:i])
+        if key in MODEL_FOOTPRINTS:
+            return MODEL_FOOTPRINTS[key]
+    return DEFAULT_FOOTPRINT
+
+
+def physical_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 16 * GB
+
+
+def default_budget():
+    override = os.environ.get("LYRICVISION_MEMORY_BUDGET_GB")
+    if override:
+        return int(float(override) * GB)
+    return int(physical_memory() * DEFAULT_BUDGET_FRACTION)
+
+
+class ModelScheduler:
+    """
+    Admits model-backed stage executions against a memory budget.
+
+    Loaded models stay resident in LRU order so later jobs reuse them;
+    when a new model or stage does not fit, unused models are unloaded
+    oldest-first, and if that is not enough the caller waits until
+    running stages release memory.
+    """
+
+    def __init__(self, budget_bytes=None):
+        self.budget = budget_bytes or default_budget()
+
+        # name -> [model, bytes, users]
+        self._resident = OrderedDict()
+        # bytes held by running stages outside the model cache (e.g. Demucs)
+        self._reserved = 0
+        # names currently being loaded by some thread
+        self._loading = set()
+        # thread id -> pins, reservations and loads it currently holds
+        self._holders = Counter()
+        self._cond = threading.Condition()
+
+    # ======================================================
+    # ACCOUNTING
+    # ======================================================
+
+    def _used(self):
+        return self._reserved + sum(entry[1] for entry in self._resident.values())
+
+    def _busy(self):
+        return self._reserved > 0 or any(entry[2] for entry in self._resident.values())
+
+    def _holding(self):
+        return self._holders[threading.get_ident()] > 0
+
+    def _hold(self):
+        self._holders[threading.get_ident()] += 1
+
+    def _release(self):
+        me = threading.get_ident()
+        self._holders[me] -= 1
+        if self._holders[me] <= 0:
+            del self._holders[me]
+
+    def _evict_for(self, needed):
+        """
+        Unloads idle models, least recently used first, until `needed`
+        bytes fit. Returns True when they fit.
+        """
+        for name in list(self._resident):
+            if self._used() + needed <= self.budget:
+                break
+            if self._resident[name][2] == 0:
+                print(f"[Scheduler] Unloading {name}")
+                del self._resident[name]
+                gc.collect()
+
+        return self._used() + needed <= self.budget
+
+    def _admit(self, needed):
+        # Something bigger than the whole budget still runs, alone.
+        # A thread already holding memory (e.g. Whisper pinned while it
+        # loads the align model) is admitted over budget instead of
+        # waiting: it could be waiting on its own pin, or on another
+        # thread that is in turn waiting on it
+        while not self._evict_for(needed) and self._busy() and not self._holding():
+            self._cond.wait()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "budget": self.budget,
+                "used": self._used(),
+                "reserved": self._reserved,
+                "resident": {name: entry[1] for name, entry in self._resident.items()},
+            }
+
+    # ======================================================
+    # PUBLIC
+    # ======================================================
+
+    @contextmanager
+    def use(self, name, loader, footprint=None):
+        """
+        Yields the model `name`, loading it with loader() if it is not
+        resident. The model is pinned (never evicted) inside the block.
+        """
+        size = footprint or footprint_for(name)
+
+        with self._cond:
+            while True:
+                entry = self._resident.get(name)
+
+                if entry is not None:
+                    entry[2] += 1
+                    self._hold()
+                    self._resident.move_to_end(name)
+                    loading = False
+                    break
+
+                if name in self._loading:
+                    self._cond.wait()
+                    continue
+
+                self._admit(size)
+
+                # Someone may have started loading it while we waited
+                if name in self._resident or name in self._loading:
+                    continue
+
+                # Load outside the lock; the slot is held as a reservation
+                self._loading.add(name)
+                self._reserved += size
+                self._hold()
+                loading = True
+                break
+
+        if loading:
+            try:
+                model = loader()
+            except Exception:
+                with self._cond:
+                    self._loading.discard(name)
+                    self._reserved -= size
+                    self._release()
+                    self._cond.notify_all()
+                raise
+
+            with self._cond:
+                self._loading.discard(name)
+                self._reserved -= size
+                entry = [model, size, 1]
+                self._resident[name] = entry
+                self._cond.notify_all()
+
+        try:
+            yield entry[0]
+        finally:
+            with self._cond:
+                entry[2] -= 1
+                self._release()
+                self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, name, footprint=None):
+        """
+        Holds memory for a stage that does not go through the model
+        cache, such as the Demucs subprocess.
+        """
+        size = footprint or footprint_for(name)
+
+        with self._cond:
+            self._admit(size)
+            self._reserved += size
+            self._hold()
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reserved -= size
+                self._release()
+                self._cond.notify_all()
+
+    def unload_all(self):
+        with self._cond:
+            for name in [n for n, e in self._resident.items() if e[2] == 0]:
+                del self._resident[name]
+            gc.collect()
+            self._cond.notify_all()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ModelScheduler()
+        return _scheduler
+
+
+def configure_scheduler(budget_bytes):
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = ModelScheduler(budget_bytes)
+        return _scheduler
@@ -2,21 +2,207 @@
 
 from typing import List
 import json
+import re
+from collections import Counter, defaultdict
 
 
 def extract_keywords(
     text: str,
     openai_key: str | None = None,
-    gemini_key: str | None = None
+    gemini_key: str | None = None,
+    provider: str | None = None
 ) -> List[str]:
 
+    if provider == "local":
+        return extract_keywords_local(text)
+
     if gemini_key:
         return _extract_with_gemini(text, gemini_key)
 
     if openai_key:
         return _extract_with_openai(text, openai_key)
 
-    raise ValueError("No valid API key provided for keyword extraction.")
+    # No key: the offline extractor still gives usable queries
+    return extract_keywords_local(text)
+
+
+# =========================================
+# LOCAL (OFFLINE)
+# =========================================
+
+STOPWORDS = set("""
+a about above after again against all am an and any are aren't as at be because
+been before being below between both but by can can't cannot could couldn't did
+didn't do does doesn't doing don't down during each few for from further had
+hadn't has hasn't have haven't having he he'd he'll he's her here here's hers
+herself him himself his how how's i i'd i'll i'm i've if in into is isn't it
+it's its itself let's me more most mustn't my myself no nor not of off on once
+only or other ought our ours ourselves out over own same shan't she she'd she'll
+she's should shouldn't so some such than that that's the their theirs them
+themselves then there there's these they they'd they'll they're they've this
+those through to too under until up very was wasn't we we'd we'll we're we've
+were weren't what what's when when's where where's which while who who's whom
+why why's with won't would wouldn't you you'd you'll you're you've your yours
+yourself yourselves
+oh ooh ohh ah ahh uh huh yeah yea ya yo hey la na da whoa woah mm mmm hmm
+baby babe gonna wanna gotta ain't ima cause 'cause cuz til 'til just like
+know got get gets getting go goes going gone come comes came say says said
+tell told make made take took want need feel feels felt thing things way
+now never ever always still back again every really one two time
+""".split())
+
+# Irregular forms the suffix rules below would get wrong
+LEMMA_EXCEPTIONS = {
+    "men": "man", "women": "woman", "children": "child", "feet": "foot",
+    "teeth": "tooth", "mice": "mouse", "geese": "goose", "knives": "knife",
+    "lives": "life", "wives": "wife", "wolves": "wolf", "leaves": "leaf",
+    "ran": "run", "running": "run", "swam": "swim", "swimming": "swim",
+    "flew": "fly", "flying": "fly", "fell": "fall", "falling": "fall",
+    "burned": "burn", "burnt": "burn", "burning": "burn", "drove": "drive", "driving": "drive", "rode": "ride",
+    "riding": "ride", "sang": "sing", "singing": "sing", "danced": "dance",
+    "dancing": "dance", "shining": "shine", "shone": "shine", "dying": "die",
+    "died": "die", "lying": "lie", "cried": "cry", "crying": "cry",
+    "kissed": "kiss", "kissing": "kiss", "bleeding": "bleed", "bled": "bleed",
+}
+
+# Abstract lyric words mapped to something a stock library can show
+CINEMATIC_TERMS = {
+    "love": "couple embracing",
+    "heart": "couple holding hands",
+    "heartbreak": "sad woman window",
+    "lonely": "person walking alone",
+    "alone": "person walking alone",
+    "free": "open road",
+    "freedom": "open road",
+    "dream": "clouds timelapse",
+    "memory": "old photographs",
+    "forever": "sunset horizon",
+    "hope": "sunrise",
+    "pain": "storm clouds",
+    "cry": "rain on window",
+    "tear": "rain on window",
+    "party": "party crowd",
+    "money": "cash money",
+    "home": "house at dusk",
+    "fly": "birds flying",
+    "fall": "falling leaves",
+    "die": "wilted flower",
+    "night": "city at night",
+    "summer": "beach summer",
+    "winter": "snow landscape",
+    "fire": "fire flames",
+    "burn": "fire flames",
+    "run": "person running",
+    "drive": "car driving at night",
+    "dance": "people dancing",
+    "sing": "singer microphone",
+    "city": "city skyline",
+    "light": "city lights bokeh",
+    "star": "starry sky",
+    "sky": "sky clouds",
+    "ocean": "ocean waves",
+    "sea": "ocean waves",
+    "rain": "rain",
+    "kiss": "couple kissing",
+}
+
+MAX_PHRASE_WORDS = 3
+
+
+def _lemma(word):
+    if word in LEMMA_EXCEPTIONS:
+        return LEMMA_EXCEPTIONS[word]
+
+    # Sung contractions: "runnin'" -> "running"
+    if word.endswith("in'"):
+        word = word[:-1] + "g"
+        if word in LEMMA_EXCEPTIONS:
+            return LEMMA_EXCEPTIONS[word]
+
+    word = word.strip("'")
+    if word.endswith("'s"):
+        word = word[:-2]
+
+    # Verb endings only when the result is a word we know; plain
+    # suffix stripping mangles nouns like "morning" or "bed"
+    for suffix in ("ing", "ed"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            stem = word[:-len(suffix)]
+            for candidate in (stem, stem + "e", stem[:-1]):
+                if candidate in CINEMATIC_TERMS:
+                    return candidate
+
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("sses", "shes", "ches", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]
+
+    return word
+
+
+def _phrases(text):
+    """
+    RAKE candidates: runs of content words between stopwords, line
+    breaks and punctuation, lemmatised, at most MAX_PHRASE_WORDS long.
+    """
+    phrases = []
+
+    for fragment in re.split(r"[\n.,;:!?()\"\-]+", text.lower()):
+        current = []
+        for token in re.findall(r"[a-z']+", fragment):
+            lemma = _lemma(token)
+            if token in STOPWORDS or lemma in STOPWORDS or len(lemma) < 3:
+                if current:
+                    phrases.append(current)
+                current = []
+                continue
+            current.append(lemma)
+            if len(current) == MAX_PHRASE_WORDS:
+                phrases.append(current)
+                current = []
+        if current:
+            phrases.append(current)
+
+    return phrases
+
+
+def extract_keywords_local(text: str, max_keywords: int = 6, cinematic: bool = True) -> List[str]:
+    """
+    Offline keyword extraction: stopword filtering, light lemmatisation
+    and RAKE scoring (word degree over frequency, summed per phrase).
+    With `cinematic`, abstract words also add a visual search query.
+    """
+    phrases = _phrases(text)
+    if not phrases:
+        return []
+
+    frequency = Counter()
+    degree = defaultdict(int)
+    for phrase in phrases:
+        for word in phrase:
+            frequency[word] += 1
+            degree[word] += len(phrase)
+
+    scores = {}
+    for phrase in phrases:
+        key = " ".join(phrase)
+        scores[key] = sum(degree[w] / frequency[w] for w in phrase)
+
+    ranked = sorted(scores, key=lambda k: (-scores[k], k))
+
+    keywords = []
+    for phrase in ranked:
+        if cinematic:
+            for word in phrase.split():
+                mapped = CINEMATIC_TERMS.get(word)
+                if mapped and mapped not in keywords:
+                    keywords.append(mapped)
+        if phrase not in keywords:
+            keywords.append(phrase)
+
+    return keywords[:max_keywords]
 
 
 # =========================================
@@ -0,0 +1,744 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================================
+# SAFETY: Force CPU + MPS fallback
+# ==========================================
+os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+from resource_config import get_resource_config
+
+# Size OpenMP pools before torch spins them up
+os.environ.setdefault("OMP_NUM_THREADS", str(get_resource_config().per_worker))
+
+import keyring
+import torch
+
+# ==========================================
+# Torch load override (PyTorch 2.6+ fix)
+# ==========================================
+_original_torch_load = torch.load
+
+
+def patched_torch_load(*args, **kwargs):
+    kwargs["weights_only"] = False
+    return _original_torch_load(*args, **kwargs)
+
+
+torch.load = patched_torch_load
+
+get_resource_config().apply_torch()
+
+# ==========================================
+# Internal Imports
+# ==========================================
+from whisper_align import transcribe_with_word_timestamps, stream_word_timestamps, resolve_model, SAMPLE_RATE
+from demucs_utils import separate_vocals
+from nlp_utils import extract_keywords, extract_keywords_local
+from video_search import VideoSearch
+from local_library import LocalLibrary
+from timeline_builder import build_word_level_timeline, coalesce_timeline, clip_usage, clip_budget
+from davinci_export import export_fcpxml
+from media_probe import probe_videos
+from clip_matching import ClipIndex, clip_durations, map_entries_to_lines
+from clip_dedupe import dedupe_videos
+from proxy_utils import generate_proxies
+from preview_render import render_preview
+from shot_analysis import analyze_videos, choose_in_points
+from shared_audio import AudioStore
+from audio_fingerprint import FingerprintIndex, FP_SAMPLE_RATE, MIN_COVERAGE, coverage, map_words, uncovered
+from ffmpeg_utils import extract_audio_range
+from media_probe import content_hash
+from job_journal import JobJournal, reconcile_downloads
+from job_control import JobCancelled
+
+APP_NAME = "LyricVision"
+
+# Extra seconds kept past the used range of a trimmed clip
+TRIM_HANDLE_SECONDS = 1.0
+
+# Upper bound on distinct clips downloaded for one timeline
+MAX_DISTINCT_CLIPS = 48
+
+# Seconds of context added around a stretch that is re-aligned
+REALIGN_MARGIN_SECONDS = 0.5
+
+KEY_NAMES = ("openai", "gemini", "pexels", "pixabay")
+
+
+def load_api_keys():
+    return {name: keyring.get_password(APP_NAME, name) for name in KEY_NAMES}
+
+
+class PipelineError(Exception):
+    """
+    A pipeline failure with a short title, shown as-is by the UI and
+    reported by the job service.
+    """
+
+    def __init__(self, title, message):
+        super().__init__(message)
+        self.title = title
+        self.message = message
+
+
+class PipelineJob:
+    """
+    Everything one run of the pipeline needs. The Tk app and the job
+    service both build one of these and hand it to plan() and render().
+    """
+
+    def __init__(
+        self,
+        audio_path,
+        bpm,
+        lyrics="",
+        keys=None,
+        model_name="gpt-4.1-mini",
+        use_whisper=True,
+        whisper_model="auto",
+        stream_alignment=False,
+        reuse_alignment=True,
+        word_timestamps=None,
+        resolution="1080p",
+        subdivision="quarter",
+        coalesce="word",
+        min_shot=0.0,
+        library_dirs=None,
+        trim_fetch=False,
+        use_proxies=False,
+        proxy_codec="h264",
+        proxy_height=540,
+        render_preview=False,
+        journal_path=None,
+        cancel=None
+    ):
+        self.audio_path = audio_path
+        self.bpm = bpm
+        self.lyrics = lyrics or ""
+        self.keys = keys or {}
+        self.model_name = model_name
+        self.use_whisper = use_whisper
+        self.whisper_model = whisper_model
+        self.stream_alignment = stream_alignment
+        self.reuse_alignment = reuse_alignment
+        self.word_timestamps = word_timestamps or []
+        self.resolution = resolution
+        self.subdivision = subdivision
+        self.coalesce = coalesce
+        self.min_shot = float(min_shot or 0.0)
+        self.library_dirs = list(library_dirs or [])
+        self.trim_fetch = trim_fetch
+        self.use_proxies = use_proxies
+        self.proxy_codec = proxy_codec
+        self.proxy_height = proxy_height
+        self.render_preview = render_preview
+        self.journal_path = journal_path
+
+        # CancelToken checked at every progress report; see _checked()
+        self.cancel = cancel
+
+        # Filled in by plan() and render()
+        self.lines = []
+        self.line_keywords = []
+        self.keywords = []
+        self.timeline = []
+        self.videos = []
+        self.budget = 0
+        self.searcher = None
+        self.preview_path = None
+
+        # Decoded audio shared by the job's stages; see close()
+        self.audio_store = None
+
+        # Stages finished by an earlier, interrupted run; see plan()
+        self.journal = None
+
+    def close(self):
+        """
+        Releases per-job resources once plan() and render() are done.
+        """
+        if self.audio_store is not None:
+            self.audio_store.close()
+            self.audio_store = None
+
+
+def _noop_progress(stage, message, fraction=None):
+    pass
+
+
+def _checked(progress, cancel):
+    """
+    Wraps a progress callback so that every report, at stage
+    boundaries and between items of batch stages, is also a point
+    where a cancelled job stops.
+    """
+    if cancel is None:
+        return progress
+
+    def checked(stage, message, fraction=None):
+        cancel.check()
+        progress(stage, message, fraction)
+
+    return checked
+
+
+def _counter(progress, stage, label):
+    """
+    on_progress(done, total) callback for batch stages that reports
+    "<label> done/total" with the matching fraction.
+    """
+    def on_progress(done, total):
+        progress(stage, f"{label} {done}/{total}...", done / total if total else None)
+    return on_progress
+
+
+def _journal_key(job):
+    """
+    Identifies the inputs a journal was written for: everything that
+    changes the alignment, keywords, search results or downloads.
+    """
+    inputs = {
+        "audio": content_hash(job.audio_path),
+        "lyrics": job.lyrics.strip(),
+        "bpm": job.bpm,
+        "model_name": job.model_name,
+        "use_whisper": job.use_whisper,
+        "whisper_model": job.whisper_model,
+        "resolution": job.resolution,
+        "subdivision": job.subdivision,
+        "coalesce": job.coalesce,
+        "min_shot": job.min_shot,
+        "library_dirs": job.library_dirs,
+        "trim_fetch": job.trim_fetch,
+    }
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def _resumed(job, stage):
+    # Artifacts of a stage an interrupted run already finished, or None
+    return job.journal.completed(stage) if job.journal is not None else None
+
+
+def _journal(job, stage, **artifacts):
+    if job.journal is not None:
+        job.journal.complete(stage, **artifacts)
+
+
+def _keyword_extractor(job):
+    """
+    Returns a function mapping one lyric line to its keywords with the
+    job's keyword model; "local" and unknown models use the offline
+    extractor.
+    """
+    openai_key = job.keys.get("openai")
+    gemini_key = job.keys.get("gemini")
+
+    if job.model_name == "local":
+        return extract_keywords_local
+
+    if job.model_name.startswith("gpt"):
+        if not openai_key:
+            raise PipelineError("Missing OpenAI Key", "Add your OpenAI key.")
+        return lambda line: extract_keywords(line, openai_key=openai_key)
+
+    if job.model_name.startswith("gemini"):
+        if not gemini_key:
+            raise PipelineError("Missing Gemini Key", "Add your Gemini key.")
+        return lambda line: extract_keywords(line, gemini_key=gemini_key)
+
+    return extract_keywords_local
+
+
+def _stream_alignment(job, vocals, raw_lyrics, model_name, progress):
+    """
+    Aligns chunk by chunk, reporting progress as words arrive, while
+    keyword extraction runs alongside on a worker thread: for lyrics
+    right away, for free transcription on each chunk's transcript,
+    which then also serves as that stretch's "line".
+    """
+    extract = _keyword_extractor(job)
+    words = []
+    chunk_lines = []
+    duration = len(vocals) / SAMPLE_RATE
+
+    def on_words(chunk_words, chunk_end):
+        progress(
+            "alignment",
+            f"Aligned {len(words) + len(chunk_words)} words ({chunk_end:.0f}s)...",
+            chunk_end / duration if duration else None
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        if raw_lyrics:
+            lines = [l.strip() for l in raw_lyrics.split("\n") if l.strip()]
+            futures = [pool.submit(extract, line) for line in lines]
+        else:
+            futures = []
+
+        for chunk_words in stream_word_timestamps(
+            vocals,
+            lyrics=raw_lyrics or None,
+            on_words=on_words,
+            model_name=model_name
+        ):
+            words += chunk_words
+
+            if chunk_words and not raw_lyrics:
+                line = " ".join(w["word"].strip() for w in chunk_words)
+                chunk_lines.append(line)
+                futures.append(pool.submit(extract, line))
+
+        progress("keywords", "Extracting keywords...")
+
+        job.word_timestamps = words
+        job.lines = lines if raw_lyrics else chunk_lines
+        job.line_keywords = [f.result() for f in futures]
+
+
+def _separate(job, audio_path, progress):
+    """
+    Vocal stem for `audio_path`; "acapella" files are used as-is.
+    """
+    if "acapella" in job.audio_path.lower():
+        return audio_path
+
+    stems_dir = os.path.join(os.path.dirname(audio_path), "stems")
+    os.makedirs(stems_dir, exist_ok=True)
+
+    progress("separation", "Separating vocals with Demucs...")
+    return separate_vocals(audio_path, stems_dir, cancel=job.cancel)
+
+
+def _reuse_alignment(job, index, model_name, model_key, progress):
+    """
+    Carries word timings over from an earlier version of the song
+    (another edit, clean or extended mix) aligned to the same lyrics
+    and found by fingerprint, and
+    re-aligns only the stretches that version does not share. Returns
+    the words, or None when nothing similar enough was processed.
+    """
+    mix = job.audio_store.load(job.audio_path, sample_rate=FP_SAMPLE_RATE)
+    duration = len(mix) / FP_SAMPLE_RATE
+
+    match = index.match(job.audio_path, mix, lyrics=job.lyrics, model=model_key)
+    if match is None:
+        return None
+
+    song_id, regions = match
+    shared = coverage(regions, duration)
+
+    if shared < MIN_COVERAGE:
+        return None
+
+    carried = map_words(index.words_for(song_id), regions)
+    words = list(carried)
+    gaps = uncovered(regions, duration)
+
+    progress(
+        "alignment",
+        f"Reusing alignment for {shared:.0%} of the song, "
+        f"re-aligning {len(gaps)} section(s)..."
+    )
+
+    for gap_start, gap_end in gaps:
+        start = max(0.0, gap_start - REALIGN_MARGIN_SECONDS)
+        end = min(duration, gap_end + REALIGN_MARGIN_SECONDS)
+
+        segment_path = os.path.join(
+            job.audio_store.root,
+            f"segment_{int(start * 1000)}.wav"
+        )
+        extract_audio_range(job.audio_path, segment_path, start, end - start)
+
+        vocals = job.audio_store.load(
+            _separate(job, segment_path, progress),
+            sample_rate=SAMPLE_RATE
+        )
+
+        # Which lyrics a new section sings is unknown, so it is
+        # transcribed rather than force-aligned. Words reaching into the
+        # gap are kept, including ones straddling its edge, unless a
+        # carried-over word already covers that time
+        for word in transcribe_with_word_timestamps(vocals, model_name=model_name):
+            word_start = word["start"] + start
+            word_end = word["end"] + start
+
+            if word_end <= gap_start or word_start >= gap_end:
+                continue
+            if any(w["start"] < word_end and word_start < w["end"] for w in carried):
+                continue
+
+            words.append({
+                "word": word["word"],
+                "start": word_start,
+                "end": word_end
+            })
+
+    return sorted(words, key=lambda w: w["start"])
+
+
+# =====================================================
+# PLAN: alignment, keywords, timeline, search
+# =====================================================
+
+def plan(job: PipelineJob, progress=_noop_progress):
+
+    progress = _checked(progress, job.cancel)
+
+    if not job.audio_path:
+        raise PipelineError("Missing Audio", "Please import audio first.")
+
+    if not job.bpm:
+        raise PipelineError("Missing BPM", "Provide or detect BPM first.")
+
+    progress("setup", f"Using BPM: {job.bpm}")
+
+    if job.journal_path and job.journal is None:
+        job.journal = JobJournal(job.journal_path, _journal_key(job))
+        if job.journal.resumed:
+            progress("setup", "Resuming the interrupted run...")
+
+    # ===============================
+    # WHISPERX + OPTIONAL DEMUCS
+    # ===============================
+
+    resumed = _resumed(job, "alignment")
+
+    if resumed:
+        job.word_timestamps = resumed["words"]
+
+    elif job.use_whisper:
+
+        raw_lyrics = job.lyrics.strip()
+
+        # "auto" lets the calibrated policy pick a size for the mode
+        model_name = None if job.whisper_model == "auto" else job.whisper_model
+
+        # Decoded audio lives in memory-mapped arrays every stage reads
+        if job.audio_store is None:
+            job.audio_store = AudioStore()
+
+        index = None
+        reused = None
+
+        # Alignments are only reused from the same Whisper model
+        model_key = ":".join(resolve_model(model_name, None, raw_lyrics))
+
+        if job.reuse_alignment:
+            try:
+                progress("alignment", "Looking for earlier versions of this song...")
+                index = FingerprintIndex()
+                reused = _reuse_alignment(job, index, model_name, model_key, progress)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                print(f"[Fingerprint Error] {e}")
+
+        if reused:
+            job.word_timestamps = reused
+
+        else:
+            try:
+                vocals_path = _separate(job, job.audio_path, progress)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                raise PipelineError("Demucs Error", str(e)) from e
+
+            # ---- Run WhisperX ----
+            progress("alignment", "Running WhisperX alignment...")
+
+            try:
+                vocals = job.audio_store.load(vocals_path, sample_rate=SAMPLE_RATE)
+
+                if job.stream_alignment:
+                    _stream_alignment(job, vocals, raw_lyrics, model_name, progress)
+                elif raw_lyrics:
+                    job.word_timestamps = transcribe_with_word_timestamps(
+                        vocals,
+                        lyrics=raw_lyrics,
+                        model_name=model_name
+                    )
+                else:
+                    job.word_timestamps = transcribe_with_word_timestamps(
+                        vocals,
+                        model_name=model_name
+                    )
+
+            except (PipelineError, JobCancelled):
+                raise
+
+            except Exception as e:
+                raise PipelineError("WhisperX Error", str(e)) from e
+
+        if index is not None and job.word_timestamps:
+            try:
+                index.add(
+                    job.audio_path,
+                    job.audio_store.load(job.audio_path, sample_rate=FP_SAMPLE_RATE),
+                    job.word_timestamps,
+                    lyrics=job.lyrics,
+                    model=model_key
+                )
+            except Exception as e:
+                print(f"[Fingerprint Error] {e}")
+
+        if not job.word_timestamps:
+            raise PipelineError(
+                "Alignment Error",
+                "No word timestamps generated."
+            )
+
+        _journal(job, "alignment", words=job.word_timestamps)
+
+    # =================================================
+    # KEYWORDS
+    # =================================================
+
+    resumed = _resumed(job, "keywords")
+
+    if resumed:
+        job.lines = resumed["lines"]
+        job.line_keywords = resumed["line_keywords"]
+
+    else:
+        if not job.line_keywords:
+            progress("keywords", "Extracting keywords...")
+
+            job.lines = [
+                l.strip()
+                for l in job.lyrics.split("\n")
+                if l.strip()
+            ]
+
+            extract = _keyword_extractor(job)
+            job.line_keywords = [extract(line) for line in job.lines]
+
+        _journal(job, "keywords", lines=job.lines, line_keywords=job.line_keywords)
+
+    job.keywords = []
+    for kws in job.line_keywords:
+        job.keywords += kws
+
+    if not job.keywords:
+        job.keywords = extract_keywords_local(
+            " ".join(w["word"] for w in job.word_timestamps)
+        )
+
+    if not job.keywords:
+        job.keywords = [w["word"] for w in job.word_timestamps]
+
+    # =================================================
+    # TIMELINE
+    # =================================================
+
+    job.timeline = build_word_level_timeline(
+        words=job.word_timestamps,
+        bpm=job.bpm,
+        subdivision=job.subdivision
+    )
+
+    if not job.timeline:
+        raise PipelineError("Timeline Error", "Timeline is empty.")
+
+    if job.coalesce != "word" or job.min_shot:
+        entries = len(job.timeline)
+        job.timeline = coalesce_timeline(
+            job.timeline,
+            policy=job.coalesce,
+            bpm=job.bpm,
+            line_map=map_entries_to_lines(job.timeline, job.lines),
+            min_shot=job.min_shot
+        )
+        progress("timeline", f"Coalesced {entries} segments into {len(job.timeline)} shots")
+
+    # =================================================
+    # VIDEO SEARCH
+    # =================================================
+
+    job.budget = clip_budget(job.timeline, max_clips=MAX_DISTINCT_CLIPS)
+
+    resumed = _resumed(job, "search")
+
+    if resumed:
+        progress("search", f"Reusing {len(resumed['videos'])} clips found before the interruption")
+        job.searcher = VideoSearch(
+            job.keys.get("pexels"),
+            job.keys.get("pixabay"),
+            resolution=job.resolution
+        )
+        job.videos = resumed["videos"]
+        return job
+
+    library = None
+
+    if job.library_dirs:
+        progress("search", "Indexing local footage...")
+        library = LocalLibrary(job.library_dirs)
+        library.scan()
+
+    progress("search", "Searching stock videos...")
+
+    job.searcher = VideoSearch(
+        job.keys.get("pexels"),
+        job.keys.get("pixabay"),
+        resolution=job.resolution,
+        local_library=library
+    )
+
+    videos = job.searcher.search(
+        job.keywords,
+        per_query=job.searcher.per_query_for(job.budget, job.keywords)
+    )
+
+    for name, health in job.searcher.health.items():
+        print(f"[Search] {name}: {health.as_dict()}")
+
+    if not videos:
+        raise PipelineError("No Videos Found", "Try different keywords.")
+
+    job.videos = job.searcher.rank(
+        videos,
+        min_duration=max(clip["duration"] for clip in job.timeline)
+    )
+
+    progress("search", "Removing near-duplicate clips...")
+    job.videos = dedupe_videos(job.videos, transport=job.searcher.transport)
+
+    # Probe results are re-read from the probe cache on resume
+    _journal(job, "search", videos=[
+        {k: v for k, v in video.items() if k != "probe"}
+        for video in job.videos
+    ])
+
+    return job
+
+
+# =====================================================
+# RENDER: download, probe, proxies, analysis, export
+# =====================================================
+
+def render(job: PipelineJob, save_path, progress=_noop_progress):
+
+    progress = _checked(progress, job.cancel)
+
+    media_dir = os.path.join(
+        os.path.dirname(save_path),
+        "media"
+    )
+
+    videos = job.videos
+    searcher = job.searcher
+
+    trim_durations = None
+
+    if job.trim_fetch:
+        # Usage is per download slot, so a replacement for a
+        # failed clip inherits the slot's trim length
+        slots = min(job.budget, len(videos))
+        assignments = ClipIndex(
+            videos[:slots], job.lines, job.line_keywords
+        ).assign(job.timeline, [None] * slots)
+        trim_durations = [
+            used + TRIM_HANDLE_SECONDS
+            for used in clip_usage(job.timeline, assignments, slots)
+        ]
+
+    on_downloaded = None
+
+    if job.journal is not None:
+        recovered = reconcile_downloads(videos, job.journal.artifacts("download"), media_dir)
+        if recovered:
+            progress("download", f"Kept {recovered} clips downloaded before the interruption")
+
+        on_downloaded = lambda video: job.journal.record("download", video["url"], video["local_path"])
+
+    progress("download", "Downloading clips...")
+    videos = searcher.download_videos(
+        videos,
+        media_dir,
+        trim_durations=trim_durations,
+        limit=job.budget,
+        on_progress=_counter(progress, "download", "Downloaded clip"),
+        on_downloaded=on_downloaded,
+        cancel=job.cancel
+    )
+    videos = [v for v in videos if v.get("local_path")]
+
+    for host, stats in searcher.transport.stats().items():
+        print(f"[HTTP] {host}: {stats}")
+
+    if not videos:
+        raise PipelineError("Download Failed", "No videos downloaded.")
+
+    progress("probe", "Probing clip metadata...")
+    videos = probe_videos(videos, on_progress=_counter(progress, "probe", "Probed clip"))
+
+    if job.use_proxies:
+        progress("proxies", "Generating proxy media...")
+        videos = generate_proxies(
+            videos,
+            os.path.join(media_dir, "proxies"),
+            codec=job.proxy_codec,
+            height=int(job.proxy_height),
+            on_progress=_counter(progress, "proxies", "Built proxy"),
+            cancel=job.cancel
+        )
+
+    progress("analysis", "Analysing shots...")
+    videos = analyze_videos(
+        videos,
+        on_progress=_counter(progress, "analysis", "Analysed clip"),
+        cancel=job.cancel
+    )
+
+    assignments = ClipIndex(videos, job.lines, job.line_keywords).assign(
+        job.timeline,
+        clip_durations(videos)
+    )
+    in_points = choose_in_points(job.timeline, assignments, videos)
+
+    progress("export", "Exporting FCPXML...")
+
+    export_fcpxml(
+        videos=videos,
+        timeline=job.timeline,
+        resolution=job.resolution,
+        output_path=save_path,
+        assignments=assignments,
+        in_points=in_points
+    )
+
+    if job.render_preview:
+        progress("preview", "Rendering preview...")
+
+        # The FCPXML is already written; a failed preview is skipped
+        # rather than failing the export
+        try:
+            job.preview_path = render_preview(
+                job.timeline,
+                videos,
+                assignments,
+                job.audio_path,
+                os.path.splitext(save_path)[0] + "_preview.mp4",
+                in_points=in_points,
+                on_progress=_counter(progress, "preview", "Rendered segment"),
+                cancel=job.cancel
+            )
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"[Preview Error] {e}")
+            job.preview_path = None
+
+    job.videos = videos
+
+    # Finished: a later run with the same inputs starts afresh
+    if job.journal is not None:
+        job.journal.clear()
+
+    return save_path
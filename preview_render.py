@@ -0,0 +1,266 @@
+import os
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from ffmpeg_utils import get_ffmpeg_path
+from resource_config import get_resource_config
+from job_control import JobCancelled, run
+
+# Fonts tried in order when none is given; drawtext falls back to
+# fontconfig's default when none exist
+FONT_CANDIDATES = [
+    "/System/Library/Fonts/Supplemental/Arial Bold.ttf",
+    "/System/Library/Fonts/Supplemental/Arial.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "C:/Windows/Fonts/arialbd.ttf",
+]
+
+
+def default_font():
+    for path in FONT_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# Shared by every segment so they concatenate without re-encoding
+SEGMENT_ENCODE_ARGS = [
+    "-an",
+    "-c:v", "libx264",
+    "-preset", "ultrafast",
+    "-crf", "30",
+    "-pix_fmt", "yuv420p",
+    "-threads", "1",
+]
+
+
+def segment_frames(timeline: List[Dict], fps=24) -> List[int]:
+    """
+    Frame count of every timeline entry: up to the next entry's start,
+    and to its own end for the last one, rounded to the frame grid so
+    rounding never accumulates across the song. Entries snapped onto
+    the same grid point as the next one overlap it and get 0 frames;
+    the segments then add up to the song's length however the timeline
+    overlaps.
+    """
+    frames = []
+    for i, clip in enumerate(timeline):
+        start = int(round(clip["start"] * fps))
+        if i < len(timeline) - 1:
+            frames.append(max(0, int(round(timeline[i + 1]["start"] * fps)) - start))
+        else:
+            end = clip.get("end", clip["start"] + clip["duration"])
+            frames.append(max(1, int(round(end * fps)) - start))
+    return frames
+
+
+def _escape_filter_path(path):
+    # Paths inside a filtergraph need ':' and '\\' escaped
+    return path.replace("\\", "/").replace(":", "\\:").replace("'", "\\'")
+
+
+def render_segment(
+    clip_path,
+    text,
+    duration,
+    output_path,
+    text_path,
+    width=640,
+    height=360,
+    fps=24,
+    font_path=None,
+    in_point=0.0,
+    cancel=None,
+    frames=None
+):
+    """
+    Renders one timeline entry: the clip from `in_point` on, scaled and
+    cropped to the preview size, looped if it is too short, with the
+    lyric burned in. `frames`, when given, overrides the length derived
+    from `duration`.
+    Every segment uses identical encoding settings so they can be
+    concatenated without re-encoding.
+    """
+    frames = frames or max(1, int(round(duration * fps)))
+
+    # Text goes through a file so lyrics never need filtergraph escaping
+    with open(text_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+    drawtext = (
+        f"drawtext=textfile='{_escape_filter_path(text_path)}'"
+        f":fontsize={max(12, height // 12)}"
+        ":fontcolor=white:borderw=2:bordercolor=black"
+        ":x=(w-text_w)/2:y=h-text_h-h/10"
+    )
+    if font_path:
+        drawtext += f":fontfile='{_escape_filter_path(font_path)}'"
+
+    vf = (
+        f"scale={width}:{height}:force_original_aspect_ratio=increase,"
+        f"crop={width}:{height},fps={fps},setsar=1,{drawtext}"
+    )
+
+    command = [
+        get_ffmpeg_path(),
+        "-y",
+        "-stream_loop", "-1",
+        "-ss", f"{in_point:.3f}",
+        "-i", clip_path,
+        "-frames:v", str(frames),
+        "-vf", vf,
+        *SEGMENT_ENCODE_ARGS,
+        output_path
+    ]
+
+    run(command, cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return output_path
+
+
+def render_gap(frames, output_path, width=640, height=360, fps=24, cancel=None):
+    """
+    Renders `frames` frames of black, encoded like render_segment()
+    output, to hold the picture while the song plays before the first
+    timeline entry.
+    """
+    command = [
+        get_ffmpeg_path(),
+        "-y",
+        "-f", "lavfi",
+        "-i", f"color=c=black:s={width}x{height}:r={fps}",
+        "-frames:v", str(int(frames)),
+        "-vf", "setsar=1",
+        *SEGMENT_ENCODE_ARGS,
+        output_path
+    ]
+
+    run(command, cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return output_path
+
+
+def render_preview(
+    timeline: List[Dict],
+    videos: List[Dict],
+    assignments: List[int],
+    audio_path,
+    output_path,
+    height=360,
+    fps=24,
+    font_path=None,
+    max_workers=None,
+    in_points=None,
+    on_progress=None,
+    cancel=None
+):
+    """
+    Renders a low-resolution MP4 of the planned edit: every timeline
+    entry is encoded in parallel, the segments are joined with stream
+    copy, and the song is muxed underneath. The picture is held black
+    until the first entry, and every entry lasts until the next one
+    starts, so each lyric shows when it is sung; entries hidden behind
+    the next one (0 frames) are skipped. Clips start from the same
+    in-points as the exported FCPXML.
+    on_progress(done, total) follows the segment renders. Cancelling
+    `cancel` kills the running encodes and removes the partial preview.
+    """
+    if not timeline:
+        raise ValueError("Timeline empty.")
+
+    width = int(round(height * 16 / 9 / 2)) * 2
+    font_path = font_path or default_font()
+    max_workers = max_workers or get_resource_config().threads_for("ffmpeg")
+
+    work_dir = tempfile.mkdtemp(prefix="lyricvision_preview_")
+
+    if in_points is None:
+        in_points = [0.0] * len(timeline)
+
+    try:
+        frames = segment_frames(timeline, fps)
+
+        jobs = []
+        for i, (clip, idx, in_point) in enumerate(zip(timeline, assignments, in_points)):
+            if not frames[i]:
+                continue
+            video = videos[idx]
+            # Proxies decode far faster than 4K originals
+            source = video.get("proxy_path") or video["local_path"]
+            jobs.append((
+                source,
+                clip.get("text", ""),
+                max(1.0 / fps, clip["duration"]),
+                os.path.join(work_dir, f"seg_{i:05d}.mp4"),
+                os.path.join(work_dir, f"seg_{i:05d}.txt"),
+                in_point,
+                frames[i],
+            ))
+
+        def _render(job):
+            source, text, duration, segment_path, text_path, in_point, segment_frames = job
+            return render_segment(
+                source, text, duration, segment_path, text_path,
+                width=width, height=height, fps=fps, font_path=font_path,
+                in_point=in_point,
+                cancel=cancel,
+                frames=segment_frames
+            )
+
+        segments = []
+
+        # The song is muxed from its own start, so the picture is held
+        # black until the first entry to keep the lyrics in sync
+        lead_frames = int(round(timeline[0]["start"] * fps))
+        if lead_frames > 0:
+            segments.append(render_gap(
+                lead_frames,
+                os.path.join(work_dir, "lead.mp4"),
+                width=width, height=height, fps=fps,
+                cancel=cancel
+            ))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for done, segment in enumerate(pool.map(_render, jobs), 1):
+                segments.append(segment)
+                if on_progress:
+                    on_progress(done, len(jobs))
+
+        list_path = os.path.join(work_dir, "segments.txt")
+        with open(list_path, "w") as f:
+            for segment in segments:
+                f.write(f"file '{segment}'\n")
+
+        ffmpeg = get_ffmpeg_path()
+        video_only = os.path.join(work_dir, "video.mp4")
+
+        run([
+            ffmpeg, "-y",
+            "-f", "concat", "-safe", "0",
+            "-i", list_path,
+            "-c", "copy",
+            video_only
+        ], cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+        run([
+            ffmpeg, "-y",
+            "-i", video_only,
+            "-i", audio_path,
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "copy",
+            "-c:a", "aac", "-b:a", "128k",
+            "-shortest",
+            output_path
+        ], cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    except JobCancelled:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return output_path
@@ -0,0 +1,102 @@
+import time
+import queue
+import threading
+
+# Progress below this share gives too noisy an ETA to show
+MIN_ETA_FRACTION = 0.02
+
+
+def estimate_eta(started, fraction, now=None):
+    """
+    Seconds left in a stage that began at `started` (time.monotonic())
+    and is `fraction` done, assuming a steady rate. None when unknown.
+    """
+    if fraction is None or not (MIN_ETA_FRACTION <= fraction < 1):
+        return None
+
+    elapsed = (now or time.monotonic()) - started
+    return elapsed * (1 - fraction) / fraction
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return ""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+class ProgressEvent:
+
+    def __init__(self, stage, message, fraction=None, eta=None):
+        self.stage = stage
+        self.message = message
+        self.fraction = fraction
+        self.eta = eta
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "message": self.message,
+            "fraction": self.fraction,
+            "eta": self.eta,
+        }
+
+
+class ProgressBus:
+    """
+    Carries structured progress from worker threads to a UI loop.
+
+    Workers call the bus like the pipeline's progress callback,
+    bus(stage, message, fraction=None); it never blocks them. The UI
+    calls drain() on its own timer, so however fast events arrive it
+    redraws at most once per tick, with only the newest event of each
+    run of same-stage updates.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._stage_started = {}
+        self._lock = threading.Lock()
+
+    def publish(self, stage, message, fraction=None):
+        now = time.monotonic()
+
+        with self._lock:
+            started = self._stage_started.setdefault(stage, now)
+
+        if fraction is not None:
+            fraction = max(0.0, min(1.0, float(fraction)))
+
+        self._queue.put(ProgressEvent(
+            stage,
+            message,
+            fraction,
+            estimate_eta(started, fraction, now)
+        ))
+
+    __call__ = publish
+
+    def drain(self):
+        """
+        Everything published since the last drain, with consecutive
+        events of one stage collapsed to the latest.
+        """
+        events = []
+
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if events and events[-1].stage == event.stage:
+                events[-1] = event
+            else:
+                events.append(event)
+
+        return events
+
+    def reset(self):
+        with self._lock:
+            self._stage_started.clear()
+        self.drain()
@@ -0,0 +1,156 @@
+import time
+import threading
+from collections import deque
+
+from http_transport import HostStats
+
+# Calls kept per provider for the error rate
+HEALTH_WINDOW = 20
+
+# Calls needed before the error rate (or latency percentiles) count
+MIN_CALLS = 4
+
+# Error rate over the window that opens the circuit
+ERROR_RATE_LIMIT = 0.5
+
+# Consecutive failures that open the circuit regardless of the window
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Seconds an open circuit rejects calls before admitting a trial call
+COOLDOWN_SECONDS = 30.0
+
+# Hedge delay used until enough latency samples exist, and its floor
+DEFAULT_HEDGE_DELAY = 3.0
+MIN_HEDGE_DELAY = 0.5
+
+
+class ProviderHealth:
+    """
+    Rolling health of one search provider with a circuit breaker.
+
+    Closed: calls go through. Open: calls are rejected until the
+    cooldown passes. Half-open: a single trial call is admitted, and
+    its outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, name, window=HEALTH_WINDOW, cooldown=COOLDOWN_SECONDS):
+        self.name = name
+        self.cooldown = cooldown
+
+        self.stats = HostStats()
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+
+        self.state = "closed"
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    # ======================================================
+    # CIRCUIT
+    # ======================================================
+
+    def _cooled_down(self):
+        return time.monotonic() - self.opened_at >= self.cooldown
+
+    def available(self):
+        """
+        True when a call would currently be admitted; does not claim
+        the half-open trial.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            return self.state == "open" and self._cooled_down()
+
+    def allow(self):
+        """
+        Admits or rejects one call. After the cooldown the first caller
+        gets the trial and everyone else is rejected until it reports.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            if self.state == "open" and self._cooled_down():
+                self.state = "half-open"
+                return True
+
+            return False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        print(f"[Health] {self.name} circuit open for {self.cooldown:.0f}s")
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.stats.requests += 1
+            self.outcomes.append(ok)
+
+            if ok:
+                self.stats.latencies.append(latency)
+                self.consecutive_failures = 0
+            else:
+                self.stats.errors += 1
+                self.consecutive_failures += 1
+
+            if self.state == "half-open":
+                if ok:
+                    self.state = "closed"
+                    # Failures from before the outage should not re-open it
+                    self.outcomes.clear()
+                    print(f"[Health] {self.name} circuit closed")
+                else:
+                    self._open()
+
+            elif self.state == "closed" and (
+                self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES
+                or (
+                    len(self.outcomes) >= MIN_CALLS
+                    and self._error_rate() >= ERROR_RATE_LIMIT
+                )
+            ):
+                self._open()
+
+    # ======================================================
+    # METRICS
+    # ======================================================
+
+    def _error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1.0 - sum(self.outcomes) / len(self.outcomes)
+
+    def hedge_delay(self):
+        """
+        Seconds one in-flight call may take before a hedge is sent: the
+        provider's p95 latency once enough calls have been seen.
+        """
+        with self._lock:
+            if len(self.stats.latencies) < MIN_CALLS:
+                return DEFAULT_HEDGE_DELAY
+            return max(MIN_HEDGE_DELAY, self.stats.percentile(95))
+
+    def as_dict(self):
+        with self._lock:
+            info = self.stats.as_dict()
+            info["state"] = self.state
+            info["error_rate"] = round(self._error_rate(), 3)
+            return info
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def provider_health(name):
+    """
+    Shared health per provider, so breaker state carries across the
+    searches of one process (e.g. every job of the job service).
+    """
+    with _health_lock:
+        health = _health.get(name)
+        if health is None:
+            health = ProviderHealth(name)
+            _health[name] = health
+        return health
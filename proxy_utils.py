@@ -0,0 +1,114 @@
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from ffmpeg_utils import get_ffmpeg_path
+from resource_config import get_resource_config
+from job_control import run
+from media_probe import file_hash
+
+# codec name -> (file extension, ffmpeg encoder arguments)
+PROXY_CODECS = {
+    "h264": (".mp4", [
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", "28",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+    ]),
+    "prores_proxy": (".mov", [
+        "-c:v", "prores_ks",
+        "-profile:v", "0",
+        "-c:a", "pcm_s16le",
+    ]),
+}
+
+
+def make_proxy(input_path, output_path, codec="h264", height=540, threads=0, cancel=None):
+    """
+    Transcodes a single clip to a low-resolution proxy.
+    Returns the proxy path.
+    """
+    if codec not in PROXY_CODECS:
+        raise ValueError(f"Unknown proxy codec: {codec}")
+
+    _, codec_args = PROXY_CODECS[codec]
+
+    command = [
+        get_ffmpeg_path(),
+        "-y",
+        "-i", input_path,
+        # -2 keeps the aspect ratio with an even width
+        "-vf", f"scale=-2:{int(height)}",
+        *codec_args,
+        # 0 lets ffmpeg pick; the pool passes its share of the budget
+        "-threads", str(int(threads)),
+        output_path
+    ]
+
+    run(command, cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return output_path
+
+
+def generate_proxies(
+    videos: List[Dict],
+    proxy_dir: str,
+    codec="h264",
+    height=540,
+    max_workers=2,
+    on_progress=None,
+    cancel=None
+) -> List[Dict]:
+    """
+    Builds proxies for every downloaded clip, running at most
+    max_workers ffmpeg processes at once. Sets video["proxy_path"]
+    on success; clips whose proxy fails are left without one.
+    on_progress(done, total) follows completion; once `cancel` is
+    cancelled running encodes are killed and the rest skipped.
+    """
+    os.makedirs(proxy_dir, exist_ok=True)
+
+    ext, _ = PROXY_CODECS[codec]
+    threads = max(1, get_resource_config().threads_for("ffmpeg") // max_workers)
+    targets = [v for v in videos if v.get("local_path")]
+
+    def _build(video):
+        if cancel is not None and cancel.cancelled:
+            return
+
+        base = os.path.splitext(os.path.basename(video["local_path"]))[0]
+        partial_path = None
+
+        try:
+            # Keyed by content as well as name: slot-named downloads and
+            # library clips sharing a basename must never reuse a proxy
+            # built from different footage
+            key = file_hash(video["local_path"])[:16]
+            output_path = os.path.join(proxy_dir, f"{base}_{key}_proxy{ext}")
+            # Encode under a temp name so an interrupted run never leaves
+            # a truncated proxy that looks finished
+            partial_path = os.path.join(proxy_dir, f"{base}_{key}_proxy.part{ext}")
+
+            if not os.path.exists(output_path):
+                make_proxy(
+                    video["local_path"],
+                    partial_path,
+                    codec=codec,
+                    height=height,
+                    threads=threads,
+                    cancel=cancel
+                )
+                os.replace(partial_path, output_path)
+            video["proxy_path"] = os.path.abspath(output_path)
+        except Exception as e:
+            print(f"[Proxy Error] {video['local_path']}: {e}")
+            if partial_path and os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for done, _ in enumerate(pool.map(_build, targets), 1):
+            if on_progress:
+                on_progress(done, len(targets))
+
+    return videos
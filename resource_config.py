@@ -0,0 +1,127 @@
+import os
+import threading
+
+STAGES = ("whisper", "align", "demucs", "ffmpeg")
+
+
+def cpu_cores():
+    override = os.environ.get("LYRICVISION_THREADS")
+    if override:
+        return max(1, int(override))
+    return os.cpu_count() or 1
+
+
+def parse_stage_threads(items):
+    """
+    Per-stage thread caps from "stage=threads" items, e.g.
+    ["whisper=4", "demucs=2"] or "whisper=4,demucs=2".
+    """
+    if isinstance(items, str):
+        items = items.split(",")
+
+    stage_threads = {}
+
+    for item in items or []:
+        item = item.strip()
+        if not item:
+            continue
+        stage, _, threads = item.partition("=")
+        stage = stage.strip()
+        if stage not in STAGES or not threads.strip().isdigit() or int(threads) < 1:
+            raise ValueError(
+                f"Invalid stage thread setting {item!r}; expected stage=threads with stage one of {', '.join(STAGES)}"
+            )
+        stage_threads[stage] = int(threads)
+
+    return stage_threads
+
+
+def env_stage_threads():
+    # LYRICVISION_STAGE_THREADS="whisper=4,demucs=2"
+    try:
+        return parse_stage_threads(os.environ.get("LYRICVISION_STAGE_THREADS", ""))
+    except ValueError as e:
+        print(f"[Resources Error] LYRICVISION_STAGE_THREADS ignored: {e}")
+        return {}
+
+
+class ResourceConfig:
+    """
+    Thread budgets per stage and per worker. In auto mode the cores are
+    split evenly across concurrent workers and every stage of a worker
+    gets that share, so parallel jobs never ask for more threads than
+    the machine has. Stages can be capped lower, from `stage_threads`
+    or the LYRICVISION_STAGE_THREADS environment variable.
+    """
+
+    def __init__(self, workers=1, total_threads=None, stage_threads=None):
+        self.workers = max(1, int(workers))
+        self.total_threads = int(total_threads) if total_threads else cpu_cores()
+        self.stage_threads = env_stage_threads()
+        self.stage_threads.update(stage_threads or {})
+
+    @property
+    def per_worker(self):
+        return max(1, self.total_threads // self.workers)
+
+    def threads_for(self, stage):
+        threads = self.stage_threads.get(stage)
+        if threads:
+            return max(1, min(int(threads), self.per_worker))
+        return self.per_worker
+
+    def subprocess_env(self, stage, base=None):
+        """
+        Environment for child processes (Demucs, ffmpeg) that size their
+        thread pools from OpenMP/MKL variables.
+        """
+        env = dict(os.environ if base is None else base)
+        threads = str(self.threads_for(stage))
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            env[var] = threads
+        return env
+
+    def apply_torch(self):
+        """
+        torch's intra-op pool is process-wide, so it is sized for one
+        worker's align stage; inter-op parallelism is disabled to avoid
+        a second pool per worker.
+        """
+        import torch
+
+        torch.set_num_threads(self.threads_for("align"))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only allowed before the first parallel op; keep what we have
+            pass
+
+    def as_dict(self):
+        return {
+            "workers": self.workers,
+            "total_threads": self.total_threads,
+            "stages": {stage: self.threads_for(stage) for stage in STAGES},
+        }
+
+
+_config = None
+_config_lock = threading.Lock()
+
+
+def get_resource_config():
+    global _config
+    with _config_lock:
+        if _config is None:
+            _config = ResourceConfig()
+        return _config
+
+
+def configure_resources(workers=1, total_threads=None, stage_threads=None):
+    global _config
+    with _config_lock:
+        _config = ResourceConfig(workers, total_threads, stage_threads)
+        config = _config
+
+    os.environ["OMP_NUM_THREADS"] = str(config.per_worker)
+    config.apply_torch()
+    return config
@@ -0,0 +1,158 @@
+import re
+from typing import List, Dict
+
+# Terms that mark AI-generated footage. Matched on word boundaries so
+# "ai" does not reject "rain", "mountain" or "train".
+DEFAULT_BLOCKLIST = [
+    "ai",
+    "ai generated",
+    "ai art",
+    "artificial",
+    "generated",
+    "midjourney",
+    "stable diffusion",
+    "dalle",
+    "dall e",
+    "suno",
+]
+
+# Relative weight of each ranking component
+SCORE_WEIGHTS = {
+    "resolution": 3.0,
+    "duration": 2.0,
+    "orientation": 1.5,
+    "relevance": 2.5,
+}
+
+
+def load_blocklist(path) -> List[str]:
+    """
+    Reads one term per line; blank lines and '#' comments are ignored.
+    """
+    terms = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                terms.append(line)
+    return terms
+
+
+def compile_blocklist(terms: List[str]):
+    """
+    Builds a single case-insensitive regex over all terms. Words inside a
+    phrase may be separated by spaces, hyphens or underscores.
+    """
+    parts = []
+    for term in terms:
+        words = [re.escape(w) for w in re.split(r"[\s_-]+", term.strip()) if w]
+        if words:
+            parts.append(r"[\s_-]+".join(words))
+
+    if not parts:
+        return None
+
+    # Longest first so phrases win over their prefixes
+    parts.sort(key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(parts) + r")\b", re.IGNORECASE)
+
+
+def _tokens(text):
+    return set(re.findall(r"[a-z]+", str(text).lower()))
+
+
+class ResultFilter:
+    """
+    Precompiled blocklist matcher plus a one-pass ranker for provider
+    search results.
+    """
+
+    def __init__(self, blocklist: List[str] = None, blocklist_path=None):
+        terms = list(DEFAULT_BLOCKLIST if blocklist is None else blocklist)
+        if blocklist_path:
+            terms += load_blocklist(blocklist_path)
+
+        self.pattern = compile_blocklist(terms)
+
+    # ======================================================
+    # FILTER
+    # ======================================================
+
+    def is_blocked(self, user_name, tags) -> bool:
+        if self.pattern is None:
+            return False
+
+        if isinstance(tags, list):
+            tags = " ".join(map(str, tags))
+
+        return bool(self.pattern.search(f"{user_name} {tags}"))
+
+    # ======================================================
+    # SCORING
+    # ======================================================
+
+    def score(self, video: Dict, target_width: int, min_duration=0.0, orientation="landscape") -> float:
+        width = video.get("width") or 0
+        height = video.get("height") or 0
+        duration = video.get("duration") or 0
+
+        # At or just above target is best; oversized files cost bandwidth,
+        # undersized ones cost quality (weighted harder)
+        if not width:
+            resolution = 0.0
+        elif width >= target_width:
+            resolution = target_width / width
+        else:
+            resolution = 0.5 * width / target_width
+
+        if not min_duration or duration >= min_duration:
+            duration_fit = 1.0
+        else:
+            duration_fit = 0.5 * duration / min_duration
+
+        if not (width and height):
+            orientation_fit = 0.5
+        elif orientation == "portrait":
+            orientation_fit = 1.0 if height > width else 0.0
+        else:
+            orientation_fit = 1.0 if width >= height else 0.0
+
+        query = _tokens(video.get("keyword_query", ""))
+        described = _tokens(video.get("tags", ""))
+        relevance = len(query & described) / len(query) if query and described else 0.0
+
+        return (
+            SCORE_WEIGHTS["resolution"] * resolution
+            + SCORE_WEIGHTS["duration"] * duration_fit
+            + SCORE_WEIGHTS["orientation"] * orientation_fit
+            + SCORE_WEIGHTS["relevance"] * relevance
+        )
+
+    def rank(
+        self,
+        videos: List[Dict],
+        target_width: int,
+        min_duration=0.0,
+        orientation="landscape"
+    ) -> List[Dict]:
+        """
+        Scores every candidate once and orders them best-first, taking the
+        best clip of each keyword before the second-best of any keyword
+        so the top of the list stays varied.
+        """
+        scored = [
+            (self.score(v, target_width, min_duration, orientation), i, v)
+            for i, v in enumerate(videos)
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        depth_of = {}
+        tiered = []
+        for score, i, video in scored:
+            keyword = video.get("keyword_query")
+            depth = depth_of.get(keyword, 0)
+            depth_of[keyword] = depth + 1
+            tiered.append((depth, -score, i, video))
+
+        tiered.sort(key=lambda item: item[:3])
+        return [video for *_, video in tiered]
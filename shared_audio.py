@@ -0,0 +1,190 @@
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+
+import numpy as np
+
+from ffmpeg_utils import get_ffmpeg_path
+from media_probe import content_hash
+
+# Header: magic, sample rate, channels, frames, padded to HEADER_SIZE
+MAGIC = b"LVAUDIO1"
+HEADER_FORMAT = "<8sIIQ"
+HEADER_SIZE = 64
+
+# Bytes copied per read while decoding into a store file
+DECODE_BLOCK = 1024 * 1024
+
+
+def _header(sample_rate, channels, frames):
+    packed = struct.pack(HEADER_FORMAT, MAGIC, int(sample_rate), int(channels), int(frames))
+    return packed.ljust(HEADER_SIZE, b"\0")
+
+
+def write_audio_array(path, samples, sample_rate):
+    """
+    Stores float32 samples (frames, or frames x channels) as a raw
+    array behind a small header, written under a temp name first so
+    readers never map a half-written file.
+    """
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    partial_path = path + ".part"
+
+    with open(partial_path, "wb") as f:
+        f.write(_header(sample_rate, channels, samples.shape[0]))
+        samples.tofile(f)
+
+    os.replace(partial_path, path)
+    return path
+
+
+def open_audio_array(path):
+    """
+    Maps a stored array read-only. Returns (samples, sample_rate); the
+    samples are an np.memmap, so every process opening the same file
+    shares its pages instead of holding a copy.
+    """
+    with open(path, "rb") as f:
+        magic, sample_rate, channels, frames = struct.unpack(
+            HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT))
+        )
+
+    if magic != MAGIC:
+        raise ValueError(f"Not a LyricVision audio array: {path}")
+
+    shape = (frames,) if channels == 1 else (frames, channels)
+    samples = np.memmap(path, dtype=np.float32, mode="r", offset=HEADER_SIZE, shape=shape)
+    return samples, sample_rate
+
+
+def decode_to_array(audio_path, output_path, sample_rate=16000, channels=1):
+    """
+    Decodes any audio file with ffmpeg straight into a stored array,
+    streaming the samples to disk rather than through Python memory.
+    """
+    # Unique per writer: another job may be decoding the same song, and
+    # whichever finishes first wins the rename with identical content
+    partial_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.part"
+
+    command = [
+        get_ffmpeg_path(),
+        "-v", "error",
+        "-nostdin",
+        "-i", audio_path,
+        "-f", "f32le",
+        "-ac", str(int(channels)),
+        "-ar", str(int(sample_rate)),
+        "-"
+    ]
+
+    with open(partial_path, "wb") as f:
+        f.write(_header(sample_rate, channels, 0))
+
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        written = 0
+        while True:
+            block = proc.stdout.read(DECODE_BLOCK)
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+        stderr = proc.stderr.read()
+
+        if proc.wait() != 0:
+            f.close()
+            os.remove(partial_path)
+            raise RuntimeError(f"ffmpeg failed to decode {audio_path}: {stderr.decode(errors='replace')}")
+
+        frames = written // (4 * channels)
+        f.seek(0)
+        f.write(_header(sample_rate, channels, frames))
+
+    os.replace(partial_path, output_path)
+    return output_path
+
+
+def shared_audio_dir():
+    path = os.path.join(tempfile.gettempdir(), "lyricvision_audio")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Arrays in the shared directory: path -> stores (jobs) holding it, and
+# a lock per path so one decode serves every job that asks at once
+_refs = Counter()
+_decode_locks = {}
+_refs_lock = threading.Lock()
+
+
+class AudioStore:
+    """
+    Decoded audio for one job, kept as memory-mapped float32 arrays.
+    Arrays live in a directory shared by all jobs and are named by
+    content hash, rate and channels, so workers on the same song decode
+    it once and map the same pages instead of holding copies. Each
+    array is reference counted and deleted once the last job using it
+    closes. `root` is the job's own scratch directory, removed on close().
+    """
+
+    def __init__(self, root=None, shared_dir=None):
+        self.root = root or tempfile.mkdtemp(prefix="lyricvision_job_")
+        self.shared_dir = shared_dir or shared_audio_dir()
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(self.shared_dir, exist_ok=True)
+        self._held = set()
+
+    def array_path(self, audio_path, sample_rate=16000, channels=1):
+        return os.path.join(
+            self.shared_dir,
+            f"{content_hash(audio_path)}_{int(sample_rate)}_{int(channels)}.f32"
+        )
+
+    def load(self, audio_path, sample_rate=16000, channels=1):
+        """
+        Returns the samples of `audio_path` at the given rate as a
+        read-only memmap, decoding on first use by any job.
+        """
+        path = self.array_path(audio_path, sample_rate, channels)
+
+        with _refs_lock:
+            if path not in self._held:
+                self._held.add(path)
+                _refs[path] += 1
+            decode_lock = _decode_locks.setdefault(path, threading.Lock())
+
+        with decode_lock:
+            if not os.path.exists(path):
+                decode_to_array(audio_path, path, sample_rate, channels)
+
+        samples, _ = open_audio_array(path)
+        return samples
+
+    def close(self):
+        with _refs_lock:
+            for path in self._held:
+                _refs[path] -= 1
+                if _refs[path] > 0:
+                    continue
+
+                del _refs[path]
+                _decode_locks.pop(path, None)
+                try:
+                    # Open memmaps keep their pages; only the name goes
+                    os.remove(path)
+                except OSError:
+                    pass
+
+            self._held.clear()
+
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
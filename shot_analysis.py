@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict
+
+from ffmpeg_utils import get_ffmpeg_path
+from media_probe import get_cache_dir, file_hash
+from resource_config import get_resource_config
+from job_control import run
+
+# Bumped whenever the stored index changes shape
+ANALYSIS_VERSION = 1
+
+# Frames per second sampled for analysis and their width in pixels
+ANALYSIS_FPS = 8
+ANALYSIS_WIDTH = 160
+
+# Scene score above which a frame counts as a cut
+SHOT_THRESHOLD = 0.3
+
+# Seconds per motion bin
+MOTION_BIN = 0.5
+
+# Opening seconds skipped when possible (fades, slates, logos)
+LEAD_IN_SECONDS = 0.5
+
+# Granularity of candidate in-points
+IN_POINT_STEP = 0.25
+
+# Score penalties: per cut inside the window, and for re-showing the
+# same stretch of a clip (scaled by the overlapping share)
+CUT_PENALTY = 0.5
+OVERLAP_PENALTY = 1.0
+
+_FRAME_RE = re.compile(r"pts_time:([\d.]+)")
+_SCORE_RE = re.compile(r"lavfi\.scene_score=([\d.]+)")
+
+
+# =========================================
+# ANALYSIS
+# =========================================
+
+def analyze_clip(path, threads=1, cancel=None):
+    """
+    Runs ffmpeg's scene detector over a downscaled copy of the clip and
+    returns its index: shot boundaries (seconds) and per-bin motion,
+    the mean frame-difference score of each MOTION_BIN with cut frames
+    left out, normalised to the clip's busiest bin.
+    """
+    command = [
+        get_ffmpeg_path(),
+        "-v", "error",
+        "-i", path,
+        "-an",
+        "-vf", (
+            f"fps={ANALYSIS_FPS},scale={ANALYSIS_WIDTH}:-2,"
+            "select='gte(scene,0)',"
+            "metadata=print:key=lavfi.scene_score:file=-"
+        ),
+        "-threads", str(int(threads)),
+        "-f", "null",
+        "-"
+    ]
+
+    proc = run(command, cancel=cancel, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    samples = []
+    current_time = None
+
+    for line in proc.stdout.decode("utf-8", "replace").splitlines():
+        frame = _FRAME_RE.search(line)
+        if frame:
+            current_time = float(frame.group(1))
+            continue
+        score = _SCORE_RE.search(line)
+        if score and current_time is not None:
+            samples.append((current_time, float(score.group(1))))
+
+    duration = samples[-1][0] + 1.0 / ANALYSIS_FPS if samples else 0.0
+    boundaries = [t for t, s in samples if s >= SHOT_THRESHOLD and t > 0]
+
+    bins = [[] for _ in range(int(duration / MOTION_BIN) + 1)]
+    for t, s in samples:
+        if s < SHOT_THRESHOLD:
+            bins[int(t / MOTION_BIN)].append(s)
+
+    motion = [sum(b) / len(b) if b else 0.0 for b in bins]
+    peak = max(motion) if motion else 0.0
+    if peak > 0:
+        motion = [m / peak for m in motion]
+
+    return {
+        "version": ANALYSIS_VERSION,
+        "duration": duration,
+        "boundaries": boundaries,
+        "motion": [round(m, 4) for m in motion],
+    }
+
+
+def analyze_cached(path, threads=1, cancel=None):
+    cache_path = os.path.join(get_cache_dir("shots"), f"{file_hash(path)}.json")
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path) as f:
+                analysis = json.load(f)
+            if analysis.get("version") == ANALYSIS_VERSION:
+                return analysis
+        except (OSError, ValueError):
+            pass
+
+    analysis = analyze_clip(path, threads=threads, cancel=cancel)
+
+    with open(cache_path, "w") as f:
+        json.dump(analysis, f)
+
+    return analysis
+
+
+def analyze_videos(videos: List[Dict], max_workers=None, on_progress=None, cancel=None) -> List[Dict]:
+    """
+    Analyses every downloaded clip in parallel (one ffmpeg process
+    each) and stores the index under video["shots"]. Clips that fail
+    keep none and start at 0s. on_progress(done, total) follows
+    completion; once `cancel` is cancelled the rest are skipped.
+    """
+    config = get_resource_config()
+    max_workers = max_workers or max(1, min(4, config.threads_for("ffmpeg")))
+    threads = max(1, config.threads_for("ffmpeg") // max_workers)
+
+    targets = [v for v in videos if v.get("local_path")]
+
+    def _analyze(video):
+        if cancel is not None and cancel.cancelled:
+            return
+        try:
+            video["shots"] = analyze_cached(video["local_path"], threads=threads, cancel=cancel)
+        except Exception as e:
+            print(f"[Shot Analysis Error] {video['local_path']}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for done, _ in enumerate(pool.map(_analyze, targets), 1):
+            if on_progress:
+                on_progress(done, len(targets))
+
+    return videos
+
+
+# =========================================
+# IN-POINTS
+# =========================================
+
+def _window_motion(motion, start, end):
+    first = int(start / MOTION_BIN)
+    last = max(first + 1, int(end / MOTION_BIN + 0.999))
+    window = motion[first:last]
+    return sum(window) / len(window) if window else 0.0
+
+
+def best_in_point(analysis, duration, clip_duration, taken=()):
+    """
+    Start time for showing `duration` seconds of a clip: past the lead-in
+    when the clip allows it, inside a single shot where possible, on the
+    most active stretch, and away from windows already shown (`taken`,
+    a list of (start, end)).
+    """
+    if not analysis:
+        return 0.0
+
+    clip_duration = clip_duration or analysis.get("duration") or 0.0
+    latest = clip_duration - duration
+
+    if latest <= 0:
+        return 0.0
+
+    earliest = LEAD_IN_SECONDS if latest >= LEAD_IN_SECONDS else 0.0
+    motion = analysis.get("motion") or []
+    boundaries = analysis.get("boundaries") or []
+
+    best_start = earliest
+    best_score = None
+
+    steps = int((latest - earliest) / IN_POINT_STEP) + 1
+
+    for step in range(steps):
+        start = earliest + step * IN_POINT_STEP
+        end = start + duration
+
+        score = _window_motion(motion, start, end)
+        score -= CUT_PENALTY * sum(1 for b in boundaries if start < b < end)
+
+        for used_start, used_end in taken:
+            overlap = min(end, used_end) - max(start, used_start)
+            if overlap > 0:
+                score -= OVERLAP_PENALTY * overlap / duration
+
+        if best_score is None or score > best_score:
+            best_start, best_score = start, score
+
+    return best_start
+
+
+def choose_in_points(timeline: List[Dict], assignments: List[int], videos: List[Dict], fps=24) -> List[float]:
+    """
+    In-point (seconds into the clip) for every timeline entry. Clips
+    without analysis start at 0s as before.
+    """
+    taken = {}
+    in_points = []
+
+    for clip, idx in zip(timeline, assignments):
+        video = videos[idx]
+        analysis = video.get("shots")
+
+        if not analysis:
+            in_points.append(0.0)
+            continue
+
+        duration = max(1.0 / fps, clip["duration"])
+        probe = video.get("probe") or {}
+        clip_duration = probe.get("duration") or video.get("duration")
+
+        start = best_in_point(analysis, duration, clip_duration, taken.get(idx, ()))
+        taken.setdefault(idx, []).append((start, start + duration))
+        in_points.append(start)
+
+    return in_points
@@ -0,0 +1,80 @@
+import threading
+
+from model_scheduler import GB, ModelScheduler
+
+# Generous for CPU-only loads that return immediately
+TIMEOUT_SECONDS = 5
+
+
+def _run_with_timeout(fn):
+    """
+    Runs fn() on a daemon thread; returns True if it finished in time.
+    """
+    thread = threading.Thread(target=fn, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT_SECONDS)
+    return not thread.is_alive()
+
+
+def test_nested_loads_under_tight_budget():
+    # Whisper (3.1 GB) + align (1.3 GB) do not fit in 4 GB together
+    scheduler = ModelScheduler(int(4 * GB))
+    loaded = []
+
+    def nested():
+        with scheduler.use("whisper:large-v3:int8", lambda: "whisper"):
+            with scheduler.use("align:en", lambda: "align") as model:
+                loaded.append(model)
+
+    assert _run_with_timeout(nested)
+    assert loaded == ["align"]
+
+
+def test_nested_loads_on_two_threads_sharing_a_pin():
+    scheduler = ModelScheduler(int(4 * GB))
+    both_pinned = threading.Barrier(2)
+    loaded = []
+
+    def nested():
+        with scheduler.use("whisper:large-v3:int8", lambda: "whisper"):
+            both_pinned.wait(TIMEOUT_SECONDS)
+            with scheduler.use("align:en", lambda: "align") as model:
+                loaded.append(model)
+
+    threads = [threading.Thread(target=nested, daemon=True) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(TIMEOUT_SECONDS)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert loaded == ["align", "align"]
+
+
+def test_unpinned_caller_still_waits_for_room():
+    scheduler = ModelScheduler(int(4 * GB))
+    pinned = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def holder():
+        with scheduler.use("whisper:large-v3:int8", lambda: "whisper"):
+            pinned.set()
+            release.wait(TIMEOUT_SECONDS)
+            order.append("released")
+
+    def waiter():
+        with scheduler.reserve("htdemucs"):
+            order.append("reserved")
+
+    threading.Thread(target=holder, daemon=True).start()
+    pinned.wait(TIMEOUT_SECONDS)
+
+    waiting = threading.Thread(target=waiter, daemon=True)
+    waiting.start()
+    waiting.join(0.2)
+    assert waiting.is_alive()
+
+    release.set()
+    waiting.join(TIMEOUT_SECONDS)
+    assert order == ["released", "reserved"]
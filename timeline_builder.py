@@ -39,4 +39,129 @@ def build_word_level_timeline(words, bpm, subdivision="quarter"):
             "end": snapped_start + duration
         })
 
-    return timeline
\ No newline at end of file
+    return timeline
+
+
+def clip_budget(timeline, max_clips=None):
+    """
+    Number of distinct clips the timeline can show: one per entry,
+    optionally capped.
+    """
+    budget = len(timeline)
+    if max_clips is not None:
+        budget = min(budget, max_clips)
+    return budget
+
+
+def assign_clips(timeline, clip_durations, fps=24):
+    """
+    Picks a clip index for every timeline entry, round-robin, skipping
+    clips that are too short to cover the entry. A duration of None
+    means unknown and is treated as long enough.
+    """
+    num_clips = len(clip_durations)
+    if not num_clips:
+        return []
+
+    assignments = []
+
+    for i, clip in enumerate(timeline):
+        duration = max(1.0 / fps, clip["duration"])
+        chosen = i % num_clips
+
+        for step in range(num_clips):
+            candidate = (i + step) % num_clips
+            available = clip_durations[candidate]
+            if available is None or available >= duration:
+                chosen = candidate
+                break
+
+        assignments.append(chosen)
+
+    return assignments
+
+
+def clip_usage(timeline, assignments, num_clips, fps=24):
+    """
+    Seconds of each clip the spine reads when every entry starts at the
+    head of its clip: the longest entry assigned to the clip. In-points
+    are later picked within whatever was downloaded.
+    """
+    usage = [0.0] * num_clips
+
+    for clip, idx in zip(timeline, assignments):
+        duration = max(1.0 / fps, clip["duration"])
+        usage[idx] = max(usage[idx], duration)
+
+    return usage
+
+
+COALESCE_POLICIES = ("word", "line", "bar")
+
+
+def coalesce_timeline(timeline, policy="word", bpm=None, line_map=None, min_shot=0.0, beats_per_bar=4):
+    """
+    Merges adjacent entries into longer shots so the spine holds fewer
+    clips. "word" keeps one entry per word, "line" merges each lyric
+    line (line_map gives every entry's line index), "bar" merges each
+    bar. Shots still shorter than min_shot seconds are then merged into
+    the next one. Merged entries keep their original entries under
+    "words" so the text can still be shown word by word.
+    """
+    if not timeline:
+        return []
+
+    if policy not in COALESCE_POLICIES:
+        raise ValueError(f"Unknown coalesce policy: {policy}")
+
+    if policy == "line":
+        keys = list(line_map) if line_map else [None] * len(timeline)
+    elif policy == "bar" and bpm:
+        bar = 60.0 / bpm * beats_per_bar
+        # Small epsilon so grid-snapped starts land in their own bar
+        keys = [int(entry["start"] / bar + 1e-6) for entry in timeline]
+    else:
+        keys = list(range(len(timeline)))
+
+    groups = []
+    for entry, key in zip(timeline, keys):
+        if groups and groups[-1][0] == key and key is not None:
+            groups[-1][1].append(entry)
+        else:
+            groups.append([key, [entry]])
+
+    shots = [entries for _, entries in groups]
+
+    if min_shot:
+        merged = []
+        pending = []
+        for entries in shots:
+            pending += entries
+            if pending[-1]["end"] - pending[0]["start"] >= min_shot:
+                merged.append(pending)
+                pending = []
+        if pending:
+            # A short tail joins the shot before it
+            if merged:
+                merged[-1] += pending
+            else:
+                merged.append(pending)
+        shots = merged
+
+    coalesced = []
+    for entries in shots:
+        if len(entries) == 1:
+            coalesced.append(entries[0])
+            continue
+
+        start = entries[0]["start"]
+        end = entries[-1]["end"]
+        coalesced.append({
+            "text": " ".join(e["text"].strip() for e in entries),
+            "start": start,
+            "duration": end - start,
+            "end": end,
+            "words": entries,
+        })
+
+    return coalesced
@@ -1,11 +1,54 @@
 # video_search.py
 
 import os
-import requests
 import time
 import re
+import math
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import List, Dict
 
+from ffmpeg_utils import fetch_clip_range
+from http_transport import default_transport
+from result_filter import ResultFilter
+from provider_health import provider_health
+from job_control import JobCancelled
+
+# (min, max) per_page accepted by each provider
+PROVIDER_PAGE_LIMITS = {
+    "Pexels": (1, 80),
+    "Pixabay": (3, 200),
+}
+
+# Pages fetched per keyword before giving up on the target
+MAX_PAGES = 3
+
+# Floor for the yield estimate so page sizes stay bounded
+MIN_YIELD = 0.25
+
+# Seconds between checks on in-flight provider calls
+HEDGE_POLL = 0.1
+
+
+class ProviderYield:
+    """
+    Running share of a provider's raw hits that survive filtering,
+    smoothed so one odd keyword does not swing the page size.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.ratio = 1.0
+        self.raw = 0
+        self.kept = 0
+
+    def record(self, raw_count, kept_count):
+        if not raw_count:
+            return
+        self.raw += raw_count
+        self.kept += kept_count
+        sample = kept_count / raw_count
+        self.ratio += self.smoothing * (sample - self.ratio)
+
 
 class VideoSearch:
 
@@ -16,7 +59,12 @@ class VideoSearch:
         resolution="1080p",
         rate_limit_delay=1.2,
         max_keywords=6,
-        batch_size=3
+        batch_size=3,
+        max_per_query=80,
+        local_library=None,
+        transport=None,
+        result_filter=None,
+        health=None
     ):
         self.target_resolution = resolution
         self.target_width = 3840 if resolution == "4K" else 1920
@@ -27,6 +75,13 @@ class VideoSearch:
         self.delay = rate_limit_delay
         self.max_keywords = max_keywords
         self.batch_size = batch_size
+        self.max_per_query = max_per_query
+        self.local_library = local_library
+        self.transport = transport or default_transport()
+        self.result_filter = result_filter or ResultFilter()
+
+        self.provider_yield = {name: ProviderYield() for name in PROVIDER_PAGE_LIMITS}
+        self.health = health or {name: provider_health(name) for name in PROVIDER_PAGE_LIMITS}
 
     # ======================================================
     # PUBLIC ENTRY
@@ -38,14 +93,57 @@ class VideoSearch:
 
         results = []
 
+        # Owned footage first: no rate limit and nothing to download
+        if self.local_library:
+            results += self.local_library.search(keywords, per_query)
+
+        providers = {}
+
         if self.pexels_key:
-            results += self._search_pexels(keywords, per_query)
+            providers["Pexels"] = self._pexels_page
 
         if self.pixabay_key:
-            results += self._search_pixabay(keywords, per_query)
+            providers["Pixabay"] = self._pixabay_page
+
+        if providers:
+            results += self._search_hedged(providers, keywords, per_query)
 
         return results
 
+    def per_query_for(self, budget: int, keywords: List[str], slack=1.5) -> int:
+        """
+        Results to request per keyword and provider so the search yields
+        about `budget` candidates, with slack for filtering and failed
+        downloads.
+        """
+        keywords = self._clean_keywords(keywords)[:self.max_keywords]
+        providers = (
+            int(bool(self.pexels_key))
+            + int(bool(self.pixabay_key))
+            + int(bool(self.local_library))
+        )
+
+        if not keywords or not providers:
+            return 0
+
+        wanted = math.ceil(budget * slack / (len(keywords) * providers))
+        return max(1, min(self.max_per_query, wanted))
+
+    # ======================================================
+    # RANKING
+    # ======================================================
+
+    def rank(self, videos: List[Dict], min_duration=0.0) -> List[Dict]:
+        """
+        Orders candidates best-first by resolution fit, duration,
+        orientation and keyword relevance, interleaving keywords.
+        """
+        return self.result_filter.rank(
+            videos,
+            self.target_width,
+            min_duration=min_duration
+        )
+
     # ======================================================
     # CLEAN KEYWORDS
     # ======================================================
@@ -71,201 +169,460 @@ class VideoSearch:
         return list(dict.fromkeys(cleaned))
 
     # ======================================================
-    # PEXELS
+    # PAGED PROVIDER SEARCH
     # ======================================================
 
-    def _search_pexels(self, keywords: List[str], per_query: int) -> List[Dict]:
-        url = "https://api.pexels.com/videos/search"
-        headers = {"Authorization": self.pexels_key}
-        results = []
+    def _page_size(self, provider: str, per_query: int) -> int:
+        """
+        Over-fetches by the provider's observed post-filter yield so one
+        request usually returns enough usable clips.
+        """
+        stats = self.provider_yield[provider]
+        min_page, max_page = PROVIDER_PAGE_LIMITS[provider]
+
+        wanted = math.ceil(per_query / max(stats.ratio, MIN_YIELD))
+        return max(min_page, min(max_page, wanted))
+
+    def _search_paged(self, provider: str, fetch_page, keyword: str, per_query: int, flight: Dict):
+        """
+        Pages one keyword on one provider. Returns (results, ok); ok is
+        False when a call failed or the circuit refused it. The start of
+        the call in flight is published in `flight` for hedging.
+        """
+        kept = []
+        page = 1
+        page_size = self._page_size(provider, per_query)
+        health = self.health[provider]
+
+        while len(kept) < per_query and page <= MAX_PAGES:
+            if not health.allow():
+                return kept, False
 
-        for keyword in keywords:
             time.sleep(self.delay)
 
-            params = {
-                "query": keyword,
-                "per_page": per_query
-            }
+            started = time.monotonic()
+            flight["since"] = started
 
             try:
-                response = requests.get(url, headers=headers, params=params, timeout=10)
+                hits, raw_count = fetch_page(keyword, page, page_size)
+            except Exception as e:
+                health.record(time.monotonic() - started, ok=False)
+                print(f"[{provider} Error] {e}")
+                return kept, False
+            finally:
+                flight["since"] = None
 
-                if response.status_code == 429:
-                    print("[Pexels] Rate limit hit. Sleeping 5 seconds...")
-                    time.sleep(5)
-                    continue
+            health.record(time.monotonic() - started, ok=True)
+            self.provider_yield[provider].record(raw_count, len(hits))
+            kept += hits
 
-                response.raise_for_status()
-                data = response.json()
+            if raw_count < page_size:
+                break  # provider has nothing more for this keyword
 
-                for video in data.get("videos", []):
+            page += 1
 
-                    if self._is_ai_content(
-                        video.get("user", {}).get("name", ""),
-                        video.get("tags", []),
-                    ):
-                        continue
+        return kept, True
 
-                    video_files = video.get("video_files", [])
-                    if not video_files:
+    # ======================================================
+    # HEDGED CROSS-PROVIDER SEARCH
+    # ======================================================
+
+    def _alternate(self, providers: Dict, provider: str):
+        """
+        Healthiest other provider to hedge with, or None.
+        """
+        others = [
+            name for name in providers
+            if name != provider and self.health[name].available()
+        ]
+        if not others:
+            return None
+        return min(others, key=lambda name: self.health[name].hedge_delay())
+
+    def _search_hedged(self, providers: Dict, keywords: List[str], per_query: int) -> List[Dict]:
+        results = []
+        pool = ThreadPoolExecutor(max_workers=2 * len(providers))
+
+        try:
+            for keyword in keywords:
+                results += self._search_keyword(pool, providers, keyword, per_query)
+        finally:
+            # Abandoned slow calls finish in the background and still
+            # feed provider health; nothing waits on them
+            pool.shutdown(wait=False)
+
+        return results
+
+    def _search_keyword(self, pool, providers: Dict, keyword: str, per_query: int) -> List[Dict]:
+        """
+        Queries every provider for one keyword concurrently. A call that
+        fails, or stays in flight past its provider's p95 latency, is
+        hedged by asking a healthy alternate for that provider's share
+        too. The keyword is done once every provider has answered or
+        been covered by a finished hedge; stragglers are not waited on.
+        """
+        flights = {}
+
+        # Providers behind an open circuit are skipped outright and the
+        # live ones take over their share
+        live = [name for name in providers if self.health[name].available()]
+        share = per_query * len(providers) // max(1, len(live))
+
+        for provider in live:
+            flight = {"provider": provider, "since": None, "hedge": None}
+            future = pool.submit(self._search_paged, provider, providers[provider], keyword, share, flight)
+            flights[future] = flight
+
+        while True:
+            pending = []
+
+            for future, flight in flights.items():
+                hedge = flight["hedge"]
+
+                if hedge is not None:
+                    if not hedge.done() and not future.done():
+                        pending += [future, hedge]
+                    elif not hedge.done() and not future.result()[1]:
+                        pending.append(hedge)
+                    continue
+
+                provider = flight["provider"]
+
+                if future.done():
+                    if future.result()[1]:
                         continue
+                    reason = "failed"
+                else:
+                    since = flight["since"]
+                    if since is None or time.monotonic() - since < self.health[provider].hedge_delay():
+                        pending.append(future)
+                        continue
+                    reason = "slow"
 
-                    video_files = sorted(
-                        video_files,
-                        key=lambda x: x.get("width", 0),
-                        reverse=True
-                    )
-
-                    candidates = [
-                        v for v in video_files
-                        if v.get("width", 0) >= self.target_width
-                    ]
-
-                    if candidates:
-                        best_file = sorted(candidates, key=lambda x: x["width"])[0]
-                    else:
-                        best_file = video_files[0]
-
-                    results.append({
-                        "source": "Pexels",
-                        "keyword_query": keyword,
-                        "url": best_file["link"],
-                        "preview": video.get("image"),
-                        "user": video.get("user", {}).get("name", "Unknown"),
-                        "duration": video.get("duration"),
-                        "width": best_file.get("width"),
-                        "height": best_file.get("height"),
-                    })
+                alternate = self._alternate(providers, provider)
+                if alternate is None:
+                    if not future.done():
+                        pending.append(future)
+                    continue
 
-            except Exception as e:
-                print(f"[Pexels Error] {e}")
+                print(f"[Search] {provider} {reason} for '{keyword}', hedging with {alternate}")
+                flight["hedge"] = pool.submit(
+                    self._search_paged,
+                    alternate,
+                    providers[alternate],
+                    keyword,
+                    # Page from the start for both shares; overlap with
+                    # the alternate's own call is dropped below
+                    share * 2,
+                    {"provider": alternate, "since": None, "hedge": None}
+                )
+                pending.append(flight["hedge"])
+
+            if not pending:
+                break
+
+            wait(pending, timeout=HEDGE_POLL, return_when=FIRST_COMPLETED)
+
+        results = []
+        seen = set()
+
+        for future, flight in flights.items():
+            for done in (future, flight["hedge"]):
+                if done is None or not done.done():
+                    continue
+                for video in done.result()[0]:
+                    if video["url"] not in seen:
+                        seen.add(video["url"])
+                        results.append(video)
 
         return results
 
     # ======================================================
-    # PIXABAY
+    # PEXELS
     # ======================================================
 
-    def _search_pixabay(self, keywords: List[str], per_query: int) -> List[Dict]:
-        url = "https://pixabay.com/api/videos/"
+    def _pexels_page(self, keyword: str, page: int, page_size: int):
+        url = "https://api.pexels.com/videos/search"
+        headers = {"Authorization": self.pexels_key}
         results = []
 
-        for keyword in keywords:
-            time.sleep(self.delay)
+        params = {
+            "query": keyword,
+            "per_page": page_size,
+            "page": page
+        }
 
-            params = {
-                "key": self.pixabay_key,
-                "q": keyword,
-                "per_page": per_query,
-            }
+        response = self.transport.get(url, headers=headers, params=params, timeout=10)
 
-            try:
-                response = requests.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        hits = data.get("videos", [])
 
-                if response.status_code == 429:
-                    print("[Pixabay] Rate limit hit. Sleeping 5 seconds...")
-                    time.sleep(5)
-                    continue
+        for video in hits:
 
-                response.raise_for_status()
-                data = response.json()
+            # Pexels rarely fills tags; the page slug describes the clip
+            tags = " ".join(map(str, video.get("tags", [])))
+            tags += " " + video.get("url", "").rstrip("/").rsplit("/", 1)[-1].replace("-", " ")
 
-                for video in data.get("hits", []):
+            if self.result_filter.is_blocked(
+                video.get("user", {}).get("name", ""),
+                tags,
+            ):
+                continue
 
-                    if self._is_ai_content(
-                        video.get("user", ""),
-                        video.get("tags", ""),
-                    ):
-                        continue
+            video_files = video.get("video_files", [])
+            if not video_files:
+                continue
 
-                    variants = list(video.get("videos", {}).values())
-                    if not variants:
-                        continue
+            video_files = sorted(
+                video_files,
+                key=lambda x: x.get("width", 0),
+                reverse=True
+            )
+
+            candidates = [
+                v for v in video_files
+                if v.get("width", 0) >= self.target_width
+            ]
+
+            if candidates:
+                best_file = sorted(candidates, key=lambda x: x["width"])[0]
+            else:
+                best_file = video_files[0]
+
+            results.append({
+                "source": "Pexels",
+                "keyword_query": keyword,
+                "url": best_file["link"],
+                "preview": video.get("image"),
+                "user": video.get("user", {}).get("name", "Unknown"),
+                "tags": tags.strip(),
+                "duration": video.get("duration"),
+                "width": best_file.get("width"),
+                "height": best_file.get("height"),
+            })
+
+        return results, len(hits)
 
-                    variants = sorted(
-                        variants,
-                        key=lambda x: x.get("width", 0),
-                        reverse=True
-                    )
-
-                    candidates = [
-                        v for v in variants
-                        if v.get("width", 0) >= self.target_width
-                    ]
-
-                    if candidates:
-                        best_variant = sorted(candidates, key=lambda x: x["width"])[0]
-                    else:
-                        best_variant = variants[0]
-
-                    results.append({
-                        "source": "Pixabay",
-                        "keyword_query": keyword,
-                        "url": best_variant.get("url"),
-                        "preview": video.get("picture_id"),
-                        "user": video.get("user", "Unknown"),
-                        "duration": video.get("duration"),
-                        "width": best_variant.get("width"),
-                        "height": best_variant.get("height"),
-                    })
+    # ======================================================
+    # PIXABAY
+    # ======================================================
 
-            except Exception as e:
-                print(f"[Pixabay Error] {e}")
+    def _pixabay_preview(self, video: Dict, variant: Dict):
+        # Newer responses carry a thumbnail per variant; older ones only
+        # the Vimeo picture id the thumbnail URL is built from
+        if variant.get("thumbnail"):
+            return variant["thumbnail"]
+        if video.get("picture_id"):
+            return f"https://i.vimeocdn.com/video/{video['picture_id']}_295x166.jpg"
+        return None
 
-        return results
+    def _pixabay_page(self, keyword: str, page: int, page_size: int):
+        url = "https://pixabay.com/api/videos/"
+        results = []
 
-    # ======================================================
-    # AI FILTER
-    # ======================================================
+        params = {
+            "key": self.pixabay_key,
+            "q": keyword,
+            "per_page": page_size,
+            "page": page,
+        }
 
-    def _is_ai_content(self, user_name, tags) -> bool:
-        if isinstance(tags, list):
-            tags = " ".join(tags)
+        response = self.transport.get(url, params=params, timeout=10)
 
-        combined = f"{user_name} {tags}".lower()
+        response.raise_for_status()
+        data = response.json()
+        hits = data.get("hits", [])
 
-        ai_indicators = [
-            "ai",
-            "artificial",
-            "generated",
-            "midjourney",
-            "stable diffusion",
-            "dalle",
-            "suno",
-        ]
+        for video in hits:
 
-        return any(indicator in combined for indicator in ai_indicators)
+            tags = video.get("tags", "")
+
+            if self.result_filter.is_blocked(
+                video.get("user", ""),
+                tags,
+            ):
+                continue
+
+            variants = list(video.get("videos", {}).values())
+            if not variants:
+                continue
+
+            variants = sorted(
+                variants,
+                key=lambda x: x.get("width", 0),
+                reverse=True
+            )
+
+            candidates = [
+                v for v in variants
+                if v.get("width", 0) >= self.target_width
+            ]
+
+            if candidates:
+                best_variant = sorted(candidates, key=lambda x: x["width"])[0]
+            else:
+                best_variant = variants[0]
+
+            results.append({
+                "source": "Pixabay",
+                "keyword_query": keyword,
+                "url": best_variant.get("url"),
+                "preview": self._pixabay_preview(video, best_variant),
+                "user": video.get("user", "Unknown"),
+                "tags": tags,
+                "duration": video.get("duration"),
+                "width": best_variant.get("width"),
+                "height": best_variant.get("height"),
+            })
+
+        return results, len(hits)
 
     # ======================================================
     # VIDEO DOWNLOADER
     # ======================================================
 
-    def download_videos(self, videos: List[Dict], download_dir: str) -> List[Dict]:
+    def download_videos(
+        self,
+        videos: List[Dict],
+        download_dir: str,
+        trim_durations: List[float] | None = None,
+        limit: int | None = None,
+        on_progress=None,
+        on_downloaded=None,
+        cancel=None
+    ) -> List[Dict]:
+        """
+        Downloads clips in list order until `limit` have succeeded
+        (all of them when limit is None); a failed download is replaced
+        by the next candidate. When trim_durations is given, the n-th
+        downloaded clip is fetched only up to trim_durations[n] via
+        ffmpeg, falling back to a full download when the server does
+        not support seeking. on_progress(done, total) is called after
+        every successful download, on_downloaded(video) once each newly
+        fetched clip is complete on disk. Cancelling `cancel` aborts the
+        download in flight and raises JobCancelled.
+        """
         os.makedirs(download_dir, exist_ok=True)
 
         downloaded = []
+        total = min(limit, len(videos)) if limit is not None else len(videos)
+
+        # Files already claimed (library clips, clips kept from an
+        # interrupted run) are never overwritten by a new download
+        taken = {os.path.abspath(v["local_path"]) for v in videos if v.get("local_path")}
+
+        for video in videos:
+            if cancel is not None:
+                cancel.check()
+
+            if limit is not None and len(downloaded) >= limit:
+                break
+
+            slot = len(downloaded)
+
+            # Library clips are already on disk
+            if video.get("local_path") and os.path.exists(video["local_path"]):
+                downloaded.append(video)
+                if on_progress:
+                    on_progress(len(downloaded), total)
+                continue
 
-        for idx, video in enumerate(videos):
             try:
                 url = video["url"]
 
                 ext = url.split("?")[0].split(".")[-1]
-                filename = f"clip_{idx+1:02d}.{ext}"
-                filepath = os.path.join(download_dir, filename)
+                stem = f"clip_{slot+1:02d}"
+                filepath = os.path.join(download_dir, f"{stem}.{ext}")
 
-                print(f"Downloading {url}")
+                copy = 1
+                while os.path.abspath(filepath) in taken:
+                    copy += 1
+                    filepath = os.path.join(download_dir, f"{stem}_{copy}.{ext}")
 
-                r = requests.get(url, stream=True, timeout=30)
-                r.raise_for_status()
+                trim_duration = None
+                if trim_durations and slot < len(trim_durations):
+                    trim_duration = trim_durations[slot]
 
-                with open(filepath, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                if not (trim_duration and self._fetch_trimmed(url, filepath, trim_duration, cancel)):
+                    self._fetch_full(url, filepath, cancel)
 
                 video["local_path"] = os.path.abspath(filepath)
+                taken.add(video["local_path"])
                 downloaded.append(video)
 
+                if on_downloaded:
+                    on_downloaded(video)
+                if on_progress:
+                    on_progress(len(downloaded), total)
+
+            except JobCancelled:
+                raise
+
             except Exception as e:
                 print(f"[Download Error] {e}")
 
-        return downloaded
\ No newline at end of file
+        return downloaded
+
+    def _fetch_full(self, url, filepath, cancel=None):
+        print(f"Downloading {url}")
+
+        root, ext = os.path.splitext(filepath)
+        partial_path = f"{root}.part{ext}"
+        stop_on_cancel = lambda: None
+
+        try:
+            r = self.transport.get(url, stream=True, timeout=30)
+            r.raise_for_status()
+
+            if cancel is not None:
+                # Closing the response unblocks a read waiting on the socket
+                stop_on_cancel = cancel.on_cancel(r.close)
+
+            with open(partial_path, "wb") as f:
+                for chunk in r.iter_content(chunk_size=8192):
+                    if cancel is not None:
+                        cancel.check()
+                    f.write(chunk)
+
+            if cancel is not None:
+                cancel.check()
+
+            os.replace(partial_path, filepath)
+
+        except Exception:
+            # A read failing because the response was closed is a cancel
+            if cancel is not None:
+                cancel.check()
+            raise
+
+        finally:
+            stop_on_cancel()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def _fetch_trimmed(self, url, filepath, duration, cancel=None) -> bool:
+        root, ext = os.path.splitext(filepath)
+        partial_path = f"{root}.part{ext}"
+
+        try:
+            head = self.transport.head(url, allow_redirects=True, timeout=10)
+            if head.headers.get("Accept-Ranges", "").lower() != "bytes":
+                return False
+
+            print(f"Fetching first {duration:.1f}s of {url}")
+
+            fetch_clip_range(url, partial_path, duration, cancel=cancel)
+            os.replace(partial_path, filepath)
+            return True
+
+        except JobCancelled:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        except Exception as e:
+            print(f"[Trimmed Fetch Error] {e} - falling back to full download")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return False
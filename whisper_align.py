@@ -1,8 +1,19 @@
 import os
+import re
+import difflib
+from contextlib import ExitStack
+import numpy as np
 import whisperx
 import torch
 
+from model_scheduler import get_scheduler
+from resource_config import get_resource_config
+
 MODEL_NAME = "large-v3"
+COMPUTE_TYPE = "int8"  # best for CPU
+
+# whisperx.load_audio always resamples to 16 kHz mono
+SAMPLE_RATE = 16000
 
 
 def get_model_cache_dir():
@@ -11,37 +22,23 @@ def get_model_cache_dir():
     return base
 
 
-def load_whisperx_model(device=None):
+def load_whisperx_model(device=None, model_name=MODEL_NAME, compute_type=COMPUTE_TYPE):
 
     # FORCE CPU — avoids MPS errors on macOS
     device = "cpu"
 
     model = whisperx.load_model(
-        MODEL_NAME,
+        model_name,
         device,
-        compute_type="int8",  # best for CPU
-        download_root=get_model_cache_dir()
+        compute_type=compute_type,
+        download_root=get_model_cache_dir(),
+        threads=get_resource_config().threads_for("whisper")
     )
 
     return model, device
 
 
-def transcribe_with_word_timestamps(audio_path, lyrics=None):
-    """
-    If lyrics is provided -> forced alignment using provided text.
-    If lyrics is None -> normal transcription + alignment.
-    """
-
-    model, device = load_whisperx_model()
-    audio = whisperx.load_audio(audio_path)
-
-    # Always transcribe first (needed for language detection)
-    result = model.transcribe(audio)
-
-    model_a, metadata = whisperx.load_align_model(
-        language_code=result["language"],
-        device=device
-    )
+def _align(result, lyrics, model_a, metadata, audio, device):
 
     # -------------------------------------------------------
     # FORCED ALIGNMENT MODE
@@ -54,7 +51,7 @@ def transcribe_with_word_timestamps(audio_path, lyrics=None):
             "end": result["segments"][-1]["end"] if result["segments"] else 0
         }]
 
-        result_aligned = whisperx.align(
+        return whisperx.align(
             custom_segments,
             model_a,
             metadata,
@@ -65,15 +62,37 @@ def transcribe_with_word_timestamps(audio_path, lyrics=None):
     # -------------------------------------------------------
     # NORMAL TRANSCRIPTION MODE
     # -------------------------------------------------------
-    else:
-        result_aligned = whisperx.align(
-            result["segments"],
-            model_a,
-            metadata,
-            audio,
-            device
-        )
+    return whisperx.align(
+        result["segments"],
+        model_a,
+        metadata,
+        audio,
+        device
+    )
+
+
+def _load_audio(audio):
+    # Paths are decoded here; arrays (e.g. memmaps from a job's
+    # AudioStore) are already 16 kHz mono float32 and used as-is
+    if isinstance(audio, np.ndarray):
+        return audio
+    return whisperx.load_audio(audio)
+
 
+def resolve_model(model_name, compute_type, lyrics):
+    """
+    (model_name, compute_type) actually used for a run; None picks the
+    calibrated model for the mode.
+    """
+    if model_name is None:
+        from whisper_calibration import select_model
+        model_name, selected_type = select_model("forced" if lyrics else "transcribe")
+        compute_type = compute_type or selected_type
+
+    return model_name, compute_type or COMPUTE_TYPE
+
+
+def _collect_words(result_aligned, offset=0.0):
     words = []
 
     for segment in result_aligned["segments"]:
@@ -81,8 +100,174 @@ def transcribe_with_word_timestamps(audio_path, lyrics=None):
             if "start" in word and "end" in word:
                 words.append({
                     "word": word["word"],
-                    "start": word["start"],
-                    "end": word["end"]
+                    "start": word["start"] + offset,
+                    "end": word["end"] + offset
                 })
 
-    return words
\ No newline at end of file
+    return words
+
+
+def transcribe_with_word_timestamps(audio_path, lyrics=None, model_name=None, compute_type=None):
+    """
+    If lyrics is provided -> forced alignment using provided text.
+    If lyrics is None -> normal transcription + alignment.
+
+    audio_path may also be an array of 16 kHz mono samples.
+
+    model_name/compute_type default to the calibrated choice for the
+    mode (see whisper_calibration), or MODEL_NAME when uncalibrated.
+    """
+
+    model_name, compute_type = resolve_model(model_name, compute_type, lyrics)
+
+    # Models stay resident in the shared scheduler between runs; each is
+    # pinned only while its step runs so the other can be evicted
+    scheduler = get_scheduler()
+    audio = _load_audio(audio_path)
+
+    with scheduler.use(
+        f"whisper:{model_name}:{compute_type}",
+        lambda: load_whisperx_model(model_name=model_name, compute_type=compute_type)
+    ) as (model, device):
+        # Always transcribe first (needed for language detection)
+        result = model.transcribe(audio)
+
+    with scheduler.use(
+        f"align:{result['language']}",
+        lambda: whisperx.load_align_model(language_code=result["language"], device=device)
+    ) as (model_a, metadata):
+        result_aligned = _align(result, lyrics, model_a, metadata, audio, device)
+
+    return _collect_words(result_aligned)
+
+
+# =========================================
+# STREAMING
+# =========================================
+
+def _quiet_cut(audio, start, end, search_seconds=2.0):
+    """
+    Moves a chunk boundary to the quietest 50 ms window in the last
+    `search_seconds` before `end`, so chunks rarely split a word.
+    """
+    window = int(0.05 * SAMPLE_RATE)
+    lo = max(start + window, end - int(search_seconds * SAMPLE_RATE))
+
+    if end >= len(audio) or end - lo < window * 2:
+        return min(end, len(audio))
+
+    tail = audio[lo:end]
+    frames = len(tail) // window
+    energy = np.square(tail[:frames * window]).reshape(frames, window).mean(axis=1)
+
+    return lo + int(np.argmin(energy)) * window + window // 2
+
+
+def _normalize(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def _lyric_span(lyric_tokens, cursor, transcript_words, last_chunk):
+    """
+    Picks the slice of lyric tokens sung in a chunk by matching the
+    chunk's rough transcript against the lyrics just after the cursor.
+    """
+    if last_chunk:
+        return len(lyric_tokens)
+
+    expected = len(transcript_words)
+    window_end = min(len(lyric_tokens), cursor + expected * 2 + 10)
+
+    matcher = difflib.SequenceMatcher(
+        a=[_normalize(t) for t in lyric_tokens[cursor:window_end]],
+        b=[_normalize(w) for w in transcript_words],
+        autojunk=False
+    )
+    blocks = [b for b in matcher.get_matching_blocks() if b.size]
+
+    if blocks:
+        last = blocks[-1]
+        # Lyrics after the last match stand in for unmatched trailing words
+        trailing = len(transcript_words) - (last.b + last.size)
+        return min(window_end, cursor + last.a + last.size + max(0, trailing))
+
+    return min(len(lyric_tokens), cursor + expected)
+
+
+def stream_word_timestamps(
+    audio_path,
+    lyrics=None,
+    chunk_seconds=30.0,
+    on_words=None,
+    model_name=None,
+    compute_type=None
+):
+    """
+    Generator version of transcribe_with_word_timestamps: processes the
+    audio in roughly chunk_seconds pieces (cut at quiet points) and
+    yields each chunk's aligned words, in song time, as soon as they
+    are ready. on_words(words, chunk_end_seconds) is called for every
+    chunk as well.
+
+    With lyrics, each chunk is force-aligned against the span of lyrics
+    its rough transcript matches, so alignment quality near chunk
+    boundaries can be slightly below the whole-song pass.
+    """
+
+    model_name, compute_type = resolve_model(model_name, compute_type, lyrics)
+
+    scheduler = get_scheduler()
+    audio = _load_audio(audio_path)
+    chunk = int(chunk_seconds * SAMPLE_RATE)
+
+    lyric_tokens = lyrics.split() if lyrics else []
+    lyric_cursor = 0
+
+    # Both models stay pinned for the whole stream
+    with ExitStack() as stack:
+        model, device = stack.enter_context(scheduler.use(
+            f"whisper:{model_name}:{compute_type}",
+            lambda: load_whisperx_model(model_name=model_name, compute_type=compute_type)
+        ))
+
+        language = None
+        model_a = metadata = None
+
+        start = 0
+
+        while start < len(audio):
+            end = _quiet_cut(audio, start, start + chunk)
+            last_chunk = end >= len(audio)
+            piece = audio[start:end]
+            offset = start / SAMPLE_RATE
+
+            result = model.transcribe(piece, language=language)
+
+            if language is None:
+                # First chunk decides the language for the whole song
+                language = result["language"]
+                model_a, metadata = stack.enter_context(scheduler.use(
+                    f"align:{language}",
+                    lambda: whisperx.load_align_model(language_code=language, device=device)
+                ))
+
+            if lyrics:
+                transcript = " ".join(s["text"] for s in result["segments"]).split()
+                span_end = _lyric_span(lyric_tokens, lyric_cursor, transcript, last_chunk)
+                chunk_lyrics = " ".join(lyric_tokens[lyric_cursor:span_end])
+                lyric_cursor = span_end
+            else:
+                chunk_lyrics = None
+
+            words = []
+
+            if result["segments"] and (chunk_lyrics or not lyrics):
+                result_aligned = _align(result, chunk_lyrics, model_a, metadata, piece, device)
+                words = _collect_words(result_aligned, offset)
+
+            if on_words:
+                on_words(words, end / SAMPLE_RATE)
+
+            yield words
+
+            start = end
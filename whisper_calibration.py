@@ -0,0 +1,270 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import difflib
+
+from media_probe import get_cache_dir
+from resource_config import get_resource_config
+
+# Smallest first; the policy walks this order
+MODEL_ORDER = ["tiny", "base", "small", "medium", "large-v3"]
+COMPUTE_TYPES = ["int8", "float32"]
+
+# Reference the other candidates are compared against
+REFERENCE = ("large-v3", "int8")
+
+# Highest acceptable real-time factor (processing seconds per audio second)
+LATENCY_TARGETS = {
+    "forced": 0.15,
+    "transcribe": 0.5,
+}
+
+# Share of reference words a model must place within TIMING_TOLERANCE
+MIN_AGREEMENT = {
+    "forced": 0.9,
+    "transcribe": 0.85,
+}
+
+TIMING_TOLERANCE = 0.1
+
+
+def calibration_path():
+    return os.path.join(get_cache_dir("calibration"), "whisper.json")
+
+
+def load_calibration():
+    path = calibration_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# =========================================
+# POLICY
+# =========================================
+
+def thread_scale(calibration, threads=None):
+    """
+    Factor applied to calibrated RTFs when running on fewer Whisper
+    threads than calibration had, e.g. as one of several job service
+    workers. Inference is taken to slow down in proportion; more
+    threads than calibrated are not counted on to speed it up.
+    """
+    calibrated = calibration.get("threads")
+    if not calibrated:
+        return 1.0
+
+    threads = threads or get_resource_config().threads_for("whisper")
+    return max(1.0, calibrated / threads)
+
+
+def select_model(mode, calibration=None, threads=None):
+    """
+    Returns (model_name, compute_type) for a job mode ("forced" or
+    "transcribe"): the smallest calibrated model that meets both the
+    latency target and the agreement floor at the current Whisper
+    thread budget (`threads`, default from the resource config).
+    Without calibration data, or when nothing qualifies, falls back to
+    the default model.
+    """
+    from whisper_align import MODEL_NAME, COMPUTE_TYPE
+
+    calibration = calibration or load_calibration()
+    if not calibration:
+        return MODEL_NAME, COMPUTE_TYPE
+
+    rows = [r for r in calibration.get("results", []) if r["mode"] == mode]
+    scale = thread_scale(calibration, threads)
+
+    accurate = [r for r in rows if r["agreement"] >= MIN_AGREEMENT[mode]]
+    fast = [r for r in accurate if r["rtf"] * scale <= LATENCY_TARGETS[mode]]
+
+    def size_key(r):
+        order = MODEL_ORDER.index(r["model"]) if r["model"] in MODEL_ORDER else len(MODEL_ORDER)
+        return order, r["rtf"]
+
+    if fast:
+        best = min(fast, key=size_key)
+    elif accurate:
+        best = min(accurate, key=lambda r: r["rtf"])
+    else:
+        return MODEL_NAME, COMPUTE_TYPE
+
+    return best["model"], best["compute_type"]
+
+
+# =========================================
+# BENCHMARK
+# =========================================
+
+def _normalize(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def timing_agreement(reference, words, tolerance=TIMING_TOLERANCE):
+    """
+    Share of reference words that the candidate also produced with a
+    start time within `tolerance` seconds.
+    """
+    if not reference:
+        return 0.0
+
+    matcher = difflib.SequenceMatcher(
+        a=[_normalize(w["word"]) for w in reference],
+        b=[_normalize(w["word"]) for w in words],
+        autojunk=False
+    )
+
+    agreed = 0
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            ref = reference[block.a + k]
+            cand = words[block.b + k]
+            if abs(ref["start"] - cand["start"]) <= tolerance:
+                agreed += 1
+
+    return agreed / len(reference)
+
+
+def _detect_language(audio):
+    """
+    Language of the calibration clip, by the reference model, so the
+    align model can be loaded before any run is timed.
+    """
+    from model_scheduler import get_scheduler
+    from whisper_align import load_whisperx_model
+
+    model_name, compute_type = REFERENCE
+
+    with get_scheduler().use(
+        f"whisper:{model_name}:{compute_type}",
+        lambda: load_whisperx_model(model_name=model_name, compute_type=compute_type)
+    ) as (model, _):
+        return model.detect_language(audio)
+
+
+def _run(audio, lyrics, model_name, compute_type, audio_seconds, language):
+    import whisperx
+    from model_scheduler import get_scheduler
+    from whisper_align import load_whisperx_model, transcribe_with_word_timestamps
+
+    scheduler = get_scheduler()
+
+    # Both models are loaded and pinned, and the audio decoded, outside
+    # the timed region; only inference counts toward RTF
+    with scheduler.use(
+        f"whisper:{model_name}:{compute_type}",
+        lambda: load_whisperx_model(model_name=model_name, compute_type=compute_type)
+    ) as (_, device), scheduler.use(
+        f"align:{language}",
+        lambda: whisperx.load_align_model(language_code=language, device=device)
+    ):
+        started = time.monotonic()
+        words = transcribe_with_word_timestamps(
+            audio,
+            lyrics=lyrics,
+            model_name=model_name,
+            compute_type=compute_type
+        )
+        elapsed = time.monotonic() - started
+
+    return words, elapsed / audio_seconds
+
+
+def calibrate(audio_path, lyrics=None, models=None, compute_types=None):
+    """
+    Benchmarks each model/compute type on a reference clip, in free
+    transcription mode and (when lyrics are given) forced alignment
+    mode, and stores real-time factor and agreement with the reference
+    model for select_model().
+    """
+    import whisperx
+
+    models = models or MODEL_ORDER
+    compute_types = compute_types or COMPUTE_TYPES
+    audio = whisperx.load_audio(audio_path)
+    audio_seconds = len(audio) / 16000
+    language = _detect_language(audio)
+
+    modes = [("transcribe", None)]
+    if lyrics:
+        modes.append(("forced", lyrics))
+
+    candidates = [(m, c) for m in models for c in compute_types]
+    # Reference first so every other run can be scored against it
+    candidates.sort(key=lambda mc: mc != REFERENCE)
+    if REFERENCE not in candidates:
+        candidates.insert(0, REFERENCE)
+
+    results = []
+
+    for mode, mode_lyrics in modes:
+        reference_words = None
+
+        for model_name, compute_type in candidates:
+            try:
+                words, rtf = _run(audio, mode_lyrics, model_name, compute_type, audio_seconds, language)
+            except Exception as e:
+                print(f"[Calibration] {model_name}/{compute_type} ({mode}) failed: {e}")
+                if reference_words is None:
+                    # Nothing else can be scored without the reference
+                    print(f"[Calibration] Reference failed, skipping {mode} mode")
+                    break
+                continue
+
+            if reference_words is None:
+                reference_words = words
+
+            agreement = timing_agreement(reference_words, words)
+            print(f"[Calibration] {mode:10} {model_name:9} {compute_type:8} rtf={rtf:.3f} agreement={agreement:.2%}")
+
+            results.append({
+                "mode": mode,
+                "model": model_name,
+                "compute_type": compute_type,
+                "rtf": rtf,
+                "agreement": agreement,
+            })
+
+    calibration = {
+        "reference_audio": os.path.abspath(audio_path),
+        "audio_seconds": audio_seconds,
+        "threads": get_resource_config().threads_for("whisper"),
+        "created": time.time(),
+        "results": results,
+    }
+
+    with open(calibration_path(), "w") as f:
+        json.dump(calibration, f, indent=2)
+
+    return calibration
+
+
+if __name__ == "__main__":
+    # Import pipeline for its CPU/torch setup before any model loads
+    import pipeline  # noqa: F401
+
+    parser = argparse.ArgumentParser(description="Calibrate Whisper model choice on this CPU")
+    parser.add_argument("audio", help="Reference vocal clip (30-60 s works well)")
+    parser.add_argument("--lyrics", help="Text file with the clip's lyrics, enables forced-alignment timing")
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--compute-types", nargs="*", default=None)
+    args = parser.parse_args(sys.argv[1:])
+
+    lyrics = None
+    if args.lyrics:
+        with open(args.lyrics, encoding="utf-8") as f:
+            lyrics = f.read()
+
+    calibration = calibrate(args.audio, lyrics, args.models, args.compute_types)
+
+    for mode in ("forced", "transcribe"):
+        if any(r["mode"] == mode for r in calibration["results"]):
+            print(f"{mode}: {select_model(mode, calibration)}")